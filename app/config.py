@@ -1,5 +1,34 @@
 import os
+from typing import Dict, Union
 
 
 def get_database_uri(db_dir: str, db_name: str) -> str:
     return f"sqlite:///{os.path.join(db_dir, db_name)}"
+
+
+def get_async_database_uri(db_dir: str, db_name: str) -> str:
+    return f"sqlite+aiosqlite:///{os.path.join(db_dir, db_name)}"
+
+
+def get_sqlite_pragmas(
+    auto_vacuum: str,
+    journal_mode: str,
+    synchronous: str,
+    busy_timeout_ms: int,
+    mmap_size: int,
+    cache_size: int,
+    temp_store: str,
+) -> Dict[str, Union[str, int]]:
+    """
+    Returns the SQLite tuning profile applied to every new connection.
+    """
+    return {
+        # Must precede table creation, existing files need a VACUUM
+        "auto_vacuum": auto_vacuum,
+        "journal_mode": journal_mode,
+        "synchronous": synchronous,
+        "busy_timeout": busy_timeout_ms,
+        "mmap_size": mmap_size,
+        "cache_size": cache_size,
+        "temp_store": temp_store,
+    }
@@ -1,45 +1,171 @@
 import logging
 import os
-from typing import Generator
+from contextlib import contextmanager
+from typing import (
+    AsyncGenerator,
+    Dict,
+    Generator,
+    Iterator,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from config import get_database_uri
-from sqlalchemy import create_engine
+from config import get_async_database_uri, get_database_uri
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.schema import CreateColumn
 
 # Base class for declarative class definitions
 Base = declarative_base()
 
 
 class Database:
-    def __init__(self, db_dir: str, db_name: str) -> None:
+    def __init__(
+        self,
+        db_dir: str,
+        db_name: str,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_recycle_secs: int = 3600,
+        pool_pre_ping: bool = True,
+        pragmas: Optional[Dict[str, Union[str, int]]] = None,
+        compact_storage: bool = False,
+    ) -> None:
         """
         Initializes the Database object with the specified directory and database name.
+        A single instance (and therefore engine and connection pool) is meant
+        to be shared by the whole process. With `compact_storage` prices are
+        stored in the compact layout, see database.layout.
         """
         self.db_dir = db_dir
         self.db_name = db_name
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_recycle_secs = pool_recycle_secs
+        self.pool_pre_ping = pool_pre_ping
+        self.pragmas = pragmas or {}
+        self.compact_storage = compact_storage
+        # Ids of the compact layout's ticker/currency pairs, never reassigned
+        self.series_ids: Dict[Tuple[str, str], int] = {}
         self.engine = None
+        self.async_engine = None
         self.setup_db()
 
     def setup_db(self) -> None:
         """
-        Sets up the database by creating the engine and sessionmaker.
+        Sets up the database by creating the engines and sessionmakers. The
+        synchronous engine serves the background jobs and the short API
+        queries, the asynchronous one the history and analytics reads.
         """
         if not os.path.exists(self.db_dir):
             os.makedirs(self.db_dir)
 
         database_uri = get_database_uri(self.db_dir, self.db_name)
-        self.engine = create_engine(database_uri)
+        self.engine = create_engine(
+            database_uri,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_recycle=self.pool_recycle_secs,
+            pool_pre_ping=self.pool_pre_ping,
+        )
+        event.listen(self.engine, "connect", self.apply_pragmas)
         self.SessionLocal = sessionmaker(
             autocommit=False, autoflush=False, bind=self.engine
         )
 
+        async_database_uri = get_async_database_uri(self.db_dir, self.db_name)
+        self.async_engine = create_async_engine(
+            async_database_uri,
+            # aiosqlite defaults to opening a connection per checkout
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_recycle=self.pool_recycle_secs,
+            pool_pre_ping=self.pool_pre_ping,
+        )
+        event.listen(
+            self.async_engine.sync_engine, "connect", self.apply_pragmas
+        )
+        self.AsyncSessionLocal = async_sessionmaker(
+            autoflush=False, bind=self.async_engine, expire_on_commit=False
+        )
+
+    def apply_pragmas(self, dbapi_connection, connection_record) -> None:
+        """
+        Applies the configured SQLite pragmas to a new connection.
+        """
+        cursor = dbapi_connection.cursor()
+        for name, value in self.pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
     def init_db(self) -> None:
         """
         Initializes the database by creating all tables.
         """
         logging.info("Initialising database")
         Base.metadata.create_all(bind=self.engine)
+        self.migrate_db()
+
+    def migrate_db(self) -> None:
+        """
+        Brings an existing database up to date with the declared models.
+        `create_all` skips tables that already exist, so columns and indexes
+        added to a model later on are created here explicitly, and indexes
+        they superseded (listed as legacy_indexes in the table info) are
+        dropped. Other indexes are left alone. Tables marked as derived are
+        recreated instead and rebuilt by their owners.
+        """
+        inspector = inspect(self.engine)
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {
+                column["name"] for column in inspector.get_columns(table.name)
+            }
+            missing_columns = [
+                column
+                for column in table.columns
+                if column.name not in existing_columns
+            ]
+            if missing_columns and table.info.get("derived"):
+                logging.info(f"Recreating derived table {table.name}")
+                table.drop(bind=self.engine)
+                table.create(bind=self.engine)
+                continue
+
+            for column in missing_columns:
+                logging.info(f"Adding column {column.name} to {table.name}")
+                column_ddl = CreateColumn(column).compile(
+                    dialect=self.engine.dialect
+                )
+                with self.engine.begin() as connection:
+                    connection.execute(
+                        text(
+                            f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"
+                        )
+                    )
+
+            existing_indexes = {
+                index["name"] for index in inspector.get_indexes(table.name)
+            }
+            legacy_indexes = set(table.info.get("legacy_indexes", ()))
+            for name in sorted(existing_indexes & legacy_indexes):
+                logging.info(f"Dropping index {name} on {table.name}")
+                with self.engine.begin() as connection:
+                    connection.execute(text(f"DROP INDEX {name}"))
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    logging.info(
+                        f"Creating index {index.name} on {table.name}"
+                    )
+                    index.create(bind=self.engine)
 
     def get_db(self) -> Generator:
         """
@@ -50,3 +176,39 @@ class Database:
             yield db
         finally:
             db.close()
+
+    async def get_async_db(self) -> AsyncGenerator[AsyncSession, None]:
+        """
+        Provides an asynchronous database session generator.
+        """
+        async with self.AsyncSessionLocal() as db:
+            yield db
+
+    @contextmanager
+    def session(self) -> Iterator[Session]:
+        """
+        Provides a database session that is closed when the block exits.
+        """
+        db = self.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def pool_status(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns the connection pool usage counters of both engines.
+        """
+        status = {}
+        for name, engine in (
+            ("sync", self.engine),
+            ("async", self.async_engine.sync_engine),
+        ):
+            pool = engine.pool
+            status[name] = {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            }
+        return status
@@ -0,0 +1,144 @@
+import logging
+from typing import Any, Dict, Iterable, List, Tuple
+
+from database.db import Database
+from database.models import BitcoinPrice, CompactPrice, PriceSeries
+from database.types import PRICE_SCALE
+from sqlalchemy import Integer, String, func, insert, select, type_coerce
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ColumnElement, FromClause
+
+# The compact layout seen with the columns of bitcoin_prices. SQLite
+# flattens the join into the outer query, so filters on ticker, currency
+# and date still seek the (series_id, ts) primary key.
+COMPACT_PRICE_ROWS = (
+    select(
+        CompactPrice.series_id,
+        PriceSeries.ticker,
+        PriceSeries.currency,
+        CompactPrice.ts.label("date"),
+        CompactPrice.price,
+        CompactPrice.weight,
+    )
+    .join_from(CompactPrice, PriceSeries)
+    .subquery("prices")
+)
+
+
+def price_rows(db_instance: Database) -> FromClause:
+    """
+    Returns the stored prices of the database's layout, with ticker,
+    currency, date, price and weight columns (and series_id in the compact
+    one).
+    """
+    if db_instance.compact_storage:
+        return COMPACT_PRICE_ROWS
+    return BitcoinPrice.__table__
+
+
+def date_text(db_instance: Database, prices: FromClause) -> ColumnElement:
+    """
+    Returns the dates as "YYYY-MM-DD HH:MM:SS.fff..." text, for readers
+    that parse them in bulk instead of per row.
+    """
+    if db_instance.compact_storage:
+        # Padded from milliseconds to the microseconds SQLAlchemy writes
+        return (
+            func.strftime(
+                "%Y-%m-%d %H:%M:%f",
+                type_coerce(prices.c.date, Integer) / 1000.0,
+                "unixepoch",
+            )
+            + "000"
+        )
+    return type_coerce(prices.c.date, String)
+
+
+def price_value(db_instance: Database, prices: FromClause) -> ColumnElement:
+    """
+    Returns the prices as floats computed in SQL, for raw DBAPI readers
+    that skip SQLAlchemy's result processing.
+    """
+    if db_instance.compact_storage:
+        return type_coerce(prices.c.price, Integer) / float(PRICE_SCALE)
+    return prices.c.price
+
+
+def has_prices(db_instance: Database) -> bool:
+    """
+    Returns whether the database holds any price yet.
+    """
+    prices = price_rows(db_instance)
+    with db_instance.session() as db:
+        return db.execute(select(prices.c.date).limit(1)).first() is not None
+
+
+def get_series_ids(
+    db: Session, db_instance: Database, pairs: Iterable[Tuple[str, str]]
+) -> Dict[Tuple[str, str], int]:
+    """
+    Returns the ids of the ticker/currency pairs in the compact layout,
+    registering the pairs seen for the first time.
+    """
+    missing = set(pairs) - db_instance.series_ids.keys()
+    if missing:
+        db.execute(
+            insert(PriceSeries).prefix_with("OR IGNORE"),
+            [
+                {"ticker": ticker, "currency": currency}
+                for ticker, currency in sorted(missing)
+            ],
+        )
+        for series_id, ticker, currency in db.execute(
+            select(PriceSeries.id, PriceSeries.ticker, PriceSeries.currency)
+        ):
+            db_instance.series_ids[(ticker, currency)] = series_id
+    return db_instance.series_ids
+
+
+def insert_prices(
+    db: Session, db_instance: Database, rows: List[Dict[str, Any]]
+) -> None:
+    """
+    Inserts price rows given as ticker, currency, price and date into the
+    database's layout.
+    """
+    if not db_instance.compact_storage:
+        db.execute(insert(BitcoinPrice), rows)
+        return
+
+    series_ids = get_series_ids(
+        db, db_instance, {(row["ticker"], row["currency"]) for row in rows}
+    )
+    # A price at the same millisecond of a pair is already stored
+    db.execute(
+        insert(CompactPrice).prefix_with("OR IGNORE"),
+        [
+            {
+                "series_id": series_ids[(row["ticker"], row["currency"])],
+                "ts": row["date"],
+                "price": row["price"],
+            }
+            for row in rows
+        ],
+    )
+
+
+def check_layout(db_instance: Database) -> None:
+    """
+    Warns when prices are stored in the layout the application does not
+    read, e.g. before the compact layout was migrated to.
+    """
+    with db_instance.session() as db:
+        legacy = db.execute(select(BitcoinPrice.id).limit(1)).first()
+        compact = db.execute(select(CompactPrice.ts).limit(1)).first()
+    if db_instance.compact_storage and legacy is not None:
+        logging.warning(
+            "The database holds prices in bitcoin_prices, which the compact "
+            "layout ignores. Run the migrate-storage command to move them."
+        )
+    if not db_instance.compact_storage and compact is not None:
+        logging.warning(
+            "The database holds prices in the compact layout, start with "
+            "--compact-storage to read them"
+        )
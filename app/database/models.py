@@ -1,15 +1,118 @@
 from database.db import Base
-from sqlalchemy import Column, DateTime, Float, Integer, String, func
+from database.types import EpochMillis, FixedPoint
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+    func,
+)
+
+# Ticker assigned to rows stored before multiple tickers were supported
+DEFAULT_TICKER = "BTC-USD"
 
 
 class BitcoinPrice(Base):
     """
-    Bitcoin prices table in different currencies along with the timestamp.
+    Ticker prices table in different currencies along with the timestamp.
     """
 
     __tablename__ = "bitcoin_prices"
+    __table_args__ = (
+        # Composite index serving both the latest-price lookup (equality on
+        # ticker and currency, ordered by date) and the average range scans.
+        # The price column is included so these queries never touch the
+        # table itself.
+        Index(
+            "ix_bitcoin_prices_ticker_currency_date",
+            "ticker",
+            "currency",
+            "date",
+            "price",
+        ),
+        # Lets the retention cleanup find expired rows in date order
+        Index("ix_bitcoin_prices_date", "date"),
+        # Indexes earlier versions created, dropped by Database.migrate_db.
+        # The (currency, date) one was superseded by the ticker one above.
+        {"info": {"legacy_indexes": ["ix_bitcoin_prices_currency_date"]}},
+    )
 
     id: Column = Column(Integer, primary_key=True, index=True)
     price: Column = Column(Float, nullable=False)
+    ticker: Column = Column(
+        String, nullable=False, server_default=DEFAULT_TICKER
+    )
     currency: Column = Column(String, nullable=False)
     date: Column = Column(DateTime, default=func.now(), nullable=False)
+    # Fetched prices the row stands for in the averages, more than one for
+    # backfilled bars
+    weight: Column = Column(Float, nullable=False, server_default="1")
+
+
+class PriceSeries(Base):
+    """
+    Registry of the ticker/currency pairs of the compact layout, so every
+    stored price refers to its pair by a small integer.
+    """
+
+    __tablename__ = "price_series"
+    __table_args__ = (UniqueConstraint("ticker", "currency"),)
+
+    id: Column = Column(Integer, primary_key=True)
+    ticker: Column = Column(String, nullable=False)
+    currency: Column = Column(String, nullable=False)
+
+
+class CompactPrice(Base):
+    """
+    Compact layout of the prices table (--compact-storage): a WITHOUT ROWID
+    table clustered on (series, timestamp), so the latest price and range
+    scans of a pair are seeks into the table itself and no secondary index
+    duplicates the rows. Timestamps are epoch milliseconds and prices
+    fixed-point integers.
+    """
+
+    __tablename__ = "compact_prices"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    series_id: Column = Column(
+        Integer, ForeignKey("price_series.id"), primary_key=True
+    )
+    ts: Column = Column(EpochMillis, primary_key=True)
+    price: Column = Column(FixedPoint, nullable=False)
+    # As bitcoin_prices.weight. Whole weights of a REAL column are written
+    # as integers, so a fetched price's 1 takes no payload byte.
+    weight: Column = Column(Float, nullable=False, server_default="1")
+
+
+class DailyPriceRollup(Base):
+    """
+    Per-ticker/currency daily aggregates of the bitcoin prices table,
+    maintained alongside every insert so averages never have to scan the
+    raw rows.
+    """
+
+    __tablename__ = "daily_price_rollups"
+    # Rebuilt from bitcoin_prices, so schema changes recreate the table
+    __table_args__ = {"info": {"derived": True}}
+
+    ticker: Column = Column(String, primary_key=True)
+    currency: Column = Column(String, primary_key=True)
+    day: Column = Column(Date, primary_key=True)
+    # Prices weighted by the fetch intervals they stand for, a backfilled
+    # bar counts as every price the fetch job would have stored in it
+    price_sum: Column = Column(Float, nullable=False)
+    price_weight: Column = Column(Float, nullable=False)
+    # Number of stored prices
+    price_count: Column = Column(Integer, nullable=False)
+    price_min: Column = Column(Float, nullable=False)
+    price_max: Column = Column(Float, nullable=False)
+    price_first: Column = Column(Float, nullable=False)
+    price_last: Column = Column(Float, nullable=False)
+    first_date: Column = Column(DateTime, nullable=False)
+    last_date: Column = Column(DateTime, nullable=False)
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeDecorator
+
+# Naive UTC, like every date the application stores
+EPOCH = datetime(1970, 1, 1)
+
+# Fixed-point prices are stored in millionths of the currency unit
+PRICE_DECIMALS = 6
+PRICE_SCALE = 10**PRICE_DECIMALS
+
+
+class EpochMillis(TypeDecorator):
+    """
+    Stores datetimes as integer milliseconds since the epoch, which SQLite
+    keeps in 6 bytes instead of a 26 character string and compares as
+    numbers. Naive values are taken as UTC and returned naive.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(
+        self, value: Optional[datetime], dialect
+    ) -> Optional[int]:
+        if value is None:
+            return None
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return (value - EPOCH) // timedelta(milliseconds=1)
+
+    def process_result_value(
+        self, value: Optional[int], dialect
+    ) -> Optional[datetime]:
+        if value is None:
+            return None
+        return EPOCH + timedelta(milliseconds=value)
+
+
+class FixedPoint(TypeDecorator):
+    """
+    Stores floats as integers with PRICE_DECIMALS decimal places. SQLite
+    stores integers in as few bytes as they need, floats always take 8.
+    Aggregates over the column (avg, min, max) are scaled back as well.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(
+        self, value: Optional[float], dialect
+    ) -> Optional[int]:
+        if value is None:
+            return None
+        return round(value * PRICE_SCALE)
+
+    def process_result_value(self, value, dialect) -> Optional[float]:
+        if value is None:
+            return None
+        return value / PRICE_SCALE
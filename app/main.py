@@ -3,17 +3,42 @@ import logging
 import os
 import signal
 import sys
+import tempfile
+from datetime import datetime, timedelta
 from typing import Any, Dict
 
 import uvicorn
+from apscheduler.schedulers.background import BackgroundScheduler
+from config import get_sqlite_pragmas
 from database.db import Database
+from database.layout import check_layout
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.openapi.utils import get_openapi
+from fastapi.responses import ORJSONResponse
 from fastapi.security import APIKeyHeader
 from routers.health import health_router
-from routers.prices import prices_router
-from services.scheduler import init_services, shutdown_services
+from routers.metrics import metrics_router
+from routers.prices import prices_router, to_utc
+from schemas.prices import ExportFormat
+from services.backfill import BACKFILL_INTERVALS, backfill_prices
+from services.export import EXPORT_BATCH_SIZE, export_prices
+from services.maintenance import vacuum_db
+from services.metrics import (
+    MULTIPROC_DIR_ENV,
+    MetricsMiddleware,
+    instrument_database,
+    register_database_collector,
+)
+from services.price_cache import latest_prices
+from services.price_sources import PRICE_SOURCES
+from services.rollups import ensure_rollups, rebuild_rollups
+from services.scheduler import (
+    init_services,
+    next_fetch_time,
+    shutdown_services,
+)
+from services.storage import MIGRATE_BATCH_SIZE, migrate_storage
 
 # requirement, allowing users to test endpoints with the "try it out"
 # feature by providing the API key.
@@ -25,8 +50,8 @@ from services.scheduler import init_services, shutdown_services
 API_KEY_NAME = "api-key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
-# Initialize FastAPI application
-app = FastAPI()
+# Initialize FastAPI application, responses are encoded with orjson
+app = FastAPI(default_response_class=ORJSONResponse)
 
 
 def custom_openapi() -> Dict[str, Any]:
@@ -87,15 +112,110 @@ def get_arguments() -> argparse.Namespace:
         required=False,
         default=int(os.getenv("RETENTION_DAYS", 365)),
     )
+    db_args.add_argument(
+        "--db-pool-size",
+        action="store",
+        type=int,
+        help="Number of connections kept in the database pool",
+        required=False,
+        default=int(os.getenv("DB_POOL_SIZE", 5)),
+    )
+    db_args.add_argument(
+        "--db-max-overflow",
+        action="store",
+        type=int,
+        help="Number of connections allowed beyond the pool size",
+        required=False,
+        default=int(os.getenv("DB_MAX_OVERFLOW", 10)),
+    )
+    db_args.add_argument(
+        "--db-pool-recycle-secs",
+        action="store",
+        type=int,
+        help="Time (in seconds) after which pooled connections are replaced",
+        required=False,
+        default=int(os.getenv("DB_POOL_RECYCLE_SECS", 3600)),
+    )
+    db_args.add_argument(
+        "--db-pool-pre-ping",
+        action=argparse.BooleanOptionalAction,
+        help="Should pooled connections be checked before use?",
+        required=False,
+        default=os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+    )
+    db_args.add_argument(
+        "--compact-storage",
+        action=argparse.BooleanOptionalAction,
+        help="Store prices with integer timestamps, a ticker/currency "
+        "dictionary and fixed-point prices (run the migrate-storage command "
+        "to move existing prices)",
+        required=False,
+        default=os.getenv("COMPACT_STORAGE", "false").lower() == "true",
+    )
+    db_args.add_argument(
+        "--sqlite-auto-vacuum",
+        action="store",
+        help="SQLite auto_vacuum mode (run the vacuum command to apply it "
+        "to an existing database)",
+        required=False,
+        default=os.getenv("SQLITE_AUTO_VACUUM", "INCREMENTAL"),
+    )
+    db_args.add_argument(
+        "--sqlite-journal-mode",
+        action="store",
+        help="SQLite journal mode (WAL lets readers run alongside the writer)",
+        required=False,
+        default=os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    )
+    db_args.add_argument(
+        "--sqlite-synchronous",
+        action="store",
+        help="SQLite synchronous setting",
+        required=False,
+        default=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    )
+    db_args.add_argument(
+        "--sqlite-busy-timeout-ms",
+        action="store",
+        type=int,
+        help="Time (in milliseconds) to wait for a locked SQLite database",
+        required=False,
+        default=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    )
+    db_args.add_argument(
+        "--sqlite-mmap-size",
+        action="store",
+        type=int,
+        help="Bytes of the SQLite database file to memory-map",
+        required=False,
+        default=int(os.getenv("SQLITE_MMAP_SIZE", 268435456)),
+    )
+    db_args.add_argument(
+        "--sqlite-cache-size",
+        action="store",
+        type=int,
+        help="SQLite page cache size (negative values are KiB)",
+        required=False,
+        default=int(os.getenv("SQLITE_CACHE_SIZE", -65536)),
+    )
+    db_args.add_argument(
+        "--sqlite-temp-store",
+        action="store",
+        help="Where SQLite keeps temporary tables and indexes",
+        required=False,
+        default=os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    )
 
     curr_args = parser.add_argument_group(title="Currency parameters")
     curr_args.add_argument(
         "-t",
+        "--tickers",
         "--ticker",
         action="store",
-        help="Ticker symbol for the cryptocurrency",
+        nargs="+",
+        help="List of ticker symbols for the cryptocurrencies",
         required=False,
-        default=os.getenv("TICKER", "BTC-USD"),
+        default=os.getenv("TICKERS", os.getenv("TICKER", "BTC-USD")).split(),
     )
     curr_args.add_argument(
         "-c",
@@ -115,6 +235,38 @@ def get_arguments() -> argparse.Namespace:
         required=False,
         default=int(os.getenv("CLEAN_UP_INTERVAL_MINS", 5)),
     )
+    svc_args.add_argument(
+        "--clean-up-batch-size",
+        action="store",
+        type=int,
+        help="Number of expired prices deleted per transaction",
+        required=False,
+        default=int(os.getenv("CLEAN_UP_BATCH_SIZE", 5000)),
+    )
+    svc_args.add_argument(
+        "--clean-up-time-budget-secs",
+        action="store",
+        type=float,
+        help="Time (in seconds) a single DB clean up may spend deleting",
+        required=False,
+        default=float(os.getenv("CLEAN_UP_TIME_BUDGET_SECS", 2)),
+    )
+    svc_args.add_argument(
+        "--clean-up-vacuum-pages",
+        action="store",
+        type=int,
+        help="Free pages returned to the file system after a DB clean up",
+        required=False,
+        default=int(os.getenv("CLEAN_UP_VACUUM_PAGES", 1000)),
+    )
+    svc_args.add_argument(
+        "--db-maintenance-interval-mins",
+        action="store",
+        type=int,
+        help="Interval (in minutes) to checkpoint and optimize the DB",
+        required=False,
+        default=int(os.getenv("DB_MAINTENANCE_INTERVAL_MINS", 60)),
+    )
     svc_args.add_argument(
         "--fetch-interval-mins",
         action="store",
@@ -122,6 +274,145 @@ def get_arguments() -> argparse.Namespace:
         required=False,
         default=int(os.getenv("FETCH_INTERVAL_MINS", 1)),
     )
+    svc_args.add_argument(
+        "--fetch-workers",
+        action="store",
+        type=int,
+        help="Maximum number of tickers to fetch concurrently",
+        required=False,
+        default=int(os.getenv("FETCH_WORKERS", 8)),
+    )
+    svc_args.add_argument(
+        "--fetch-timeout-secs",
+        action="store",
+        type=float,
+        help="Time (in seconds) to wait for a single ticker or FX request",
+        required=False,
+        default=float(os.getenv("FETCH_TIMEOUT_SECS", 10)),
+    )
+    svc_args.add_argument(
+        "--fetch-retries",
+        action="store",
+        type=int,
+        help="Number of times to retry a failed ticker or FX fetch",
+        required=False,
+        default=int(os.getenv("FETCH_RETRIES", 2)),
+    )
+    svc_args.add_argument(
+        "--fetch-retry-backoff-secs",
+        action="store",
+        type=float,
+        help="Base delay (in seconds) of the jittered exponential backoff "
+        "between retries",
+        required=False,
+        default=float(os.getenv("FETCH_RETRY_BACKOFF_SECS", 1)),
+    )
+    svc_args.add_argument(
+        "--circuit-breaker-failures",
+        action="store",
+        type=int,
+        help="Consecutive failed fetches after which a ticker or FX pair is "
+        "skipped",
+        required=False,
+        default=int(os.getenv("CIRCUIT_BREAKER_FAILURES", 5)),
+    )
+    svc_args.add_argument(
+        "--circuit-breaker-reset-mins",
+        action="store",
+        type=float,
+        help="Time (in minutes) to skip a failing ticker or FX pair before "
+        "trying it again",
+        required=False,
+        default=float(os.getenv("CIRCUIT_BREAKER_RESET_MINS", 5)),
+    )
+    svc_args.add_argument(
+        "--price-source",
+        action="store",
+        choices=PRICE_SOURCES,
+        help="Where to fetch ticker and FX quotes from: yfinance, the Yahoo "
+        "Finance chart API over plain HTTP, or a replayed recording",
+        required=False,
+        default=os.getenv("PRICE_SOURCE", "yfinance"),
+    )
+    svc_args.add_argument(
+        "--replay-file",
+        action="store",
+        help="CSV file of recorded quotes for the replay price source",
+        required=False,
+        default=os.getenv("REPLAY_FILE", ""),
+    )
+    svc_args.add_argument(
+        "--replay-speed",
+        action="store",
+        type=float,
+        help="How many times faster than recorded to replay quotes",
+        required=False,
+        default=float(os.getenv("REPLAY_SPEED", 1)),
+    )
+    svc_args.add_argument(
+        "--record-quotes-file",
+        action="store",
+        help="CSV file to append every fetched quote to, for replaying",
+        required=False,
+        default=os.getenv("RECORD_QUOTES_FILE", ""),
+    )
+    svc_args.add_argument(
+        "--fx-cache-ttl-mins",
+        action="store",
+        type=float,
+        help="Time (in minutes) to reuse fetched FX rates",
+        required=False,
+        default=float(os.getenv("FX_CACHE_TTL_MINS", 60)),
+    )
+    svc_args.add_argument(
+        "--stream-queue-size",
+        action="store",
+        type=int,
+        help="Number of price messages a stream client can fall behind "
+        "before it is disconnected",
+        required=False,
+        default=int(os.getenv("STREAM_QUEUE_SIZE", 16)),
+    )
+    svc_args.add_argument(
+        "--backfill-days",
+        action="store",
+        type=float,
+        help="Days of history to backfill on startup when the database is "
+        "empty (0 to disable)",
+        required=False,
+        default=float(os.getenv("BACKFILL_DAYS", 0)),
+    )
+    svc_args.add_argument(
+        "--analytics-window-mins",
+        action="store",
+        nargs="+",
+        type=float,
+        help="Windows (in minutes) whose rolling analytics are maintained as "
+        "prices are stored, other windows are computed from the database",
+        required=False,
+        default=[
+            float(mins)
+            for mins in os.getenv("ANALYTICS_WINDOW_MINS", "60 1440").split()
+        ],
+    )
+    svc_args.add_argument(
+        "--max-data-age-mins",
+        action="store",
+        type=float,
+        help="Age (in minutes) of the newest price after which /health "
+        "reports the application unhealthy (0 to disable)",
+        required=False,
+        default=float(os.getenv("MAX_DATA_AGE_MINS", 10)),
+    )
+    svc_args.add_argument(
+        "--cache-refresh-secs",
+        action="store",
+        type=float,
+        help="Interval (in seconds) at which workers not running the "
+        "background jobs reload the latest prices from the DB",
+        required=False,
+        default=float(os.getenv("CACHE_REFRESH_SECS", 5)),
+    )
 
     parser.add_argument(
         "--api-key",
@@ -150,11 +441,131 @@ def get_arguments() -> argparse.Namespace:
     parser.add_argument(
         "--port",
         action="store",
+        type=int,
         help="Bind socket to this port",
         required=False,
         default=int(os.getenv("PORT", 8000)),
     )
 
+    parser.add_argument(
+        "--workers",
+        action="store",
+        type=int,
+        help="Number of API worker processes, one of them runs the "
+        "background jobs",
+        required=False,
+        default=int(os.getenv("WORKERS", 1)),
+    )
+
+    # Without a command the API and its background services are started
+    commands = parser.add_subparsers(dest="command", title="Commands")
+    commands.add_parser(
+        "rebuild-rollups",
+        help="Recompute the daily price rollups from the stored prices",
+    )
+    commands.add_parser(
+        "vacuum",
+        help="Rebuild the database file and apply the auto_vacuum mode",
+    )
+    migrate_command = commands.add_parser(
+        "migrate-storage",
+        help="Move the stored prices into the compact layout",
+    )
+    migrate_command.add_argument(
+        "--batch-size",
+        action="store",
+        type=int,
+        help="Prices copied per transaction",
+        required=False,
+        default=MIGRATE_BATCH_SIZE,
+    )
+    backfill_command = commands.add_parser(
+        "backfill",
+        help="Load historical prices of the tickers and currencies",
+    )
+    backfill_command.add_argument(
+        "--days",
+        action="store",
+        type=float,
+        help="Days of history to load",
+        required=False,
+        default=30,
+    )
+    backfill_command.add_argument(
+        "--interval",
+        action="store",
+        choices=BACKFILL_INTERVALS,
+        help="Bar interval (default: the finest one available for --days)",
+        required=False,
+        default=None,
+    )
+    export_command = commands.add_parser(
+        "export",
+        help="Stream the stored prices as NDJSON, CSV or Parquet",
+    )
+    export_command.add_argument(
+        "--format",
+        action="store",
+        dest="export_format",
+        choices=[export_format.value for export_format in ExportFormat],
+        help="Output format",
+        required=False,
+        default=ExportFormat.NDJSON.value,
+    )
+    export_command.add_argument(
+        "-o",
+        "--output",
+        action="store",
+        help="Output file, - for stdout",
+        required=False,
+        default="-",
+    )
+    export_command.add_argument(
+        "--ticker",
+        action="store",
+        dest="export_ticker",
+        metavar="TICKER",
+        help="Only export this ticker (default: all)",
+        required=False,
+        default=None,
+    )
+    export_command.add_argument(
+        "--currency",
+        action="append",
+        dest="export_currencies",
+        metavar="CURRENCY",
+        help="Only export this currency, can be repeated (default: all)",
+        required=False,
+        default=None,
+    )
+    export_command.add_argument(
+        "--start",
+        action="store",
+        type=datetime.fromisoformat,
+        help="Only export prices from this ISO time on (UTC unless an "
+        "offset is given)",
+        required=False,
+        default=None,
+    )
+    export_command.add_argument(
+        "--end",
+        action="store",
+        type=datetime.fromisoformat,
+        help="Only export prices before this ISO time",
+        required=False,
+        default=None,
+    )
+    export_command.add_argument(
+        "--batch-size",
+        action="store",
+        dest="export_batch_size",
+        metavar="BATCH_SIZE",
+        type=int,
+        help="Rows read and encoded per chunk",
+        required=False,
+        default=EXPORT_BATCH_SIZE,
+    )
+
     return parser.parse_args()
 
 
@@ -167,30 +578,167 @@ def signal_handler(sig, frame) -> None:
     sys.exit(0)
 
 
-if __name__ == "__main__":
-    global scheduler
-    args = get_arguments()
-
+def configure_logging(args: argparse.Namespace) -> None:
     logging.basicConfig(
         level=logging.DEBUG if args.debug else logging.INFO,
         format="%(asctime)s - " "%(name)s - " "%(levelname)s - " "%(message)s",
     )
 
+
+def create_database(args: argparse.Namespace) -> Database:
+    """
+    Creates the database instance shared by the whole process.
+    """
+    return Database(
+        args.dir,
+        args.name,
+        pool_size=args.db_pool_size,
+        max_overflow=args.db_max_overflow,
+        pool_recycle_secs=args.db_pool_recycle_secs,
+        pool_pre_ping=args.db_pool_pre_ping,
+        compact_storage=args.compact_storage,
+        pragmas=get_sqlite_pragmas(
+            auto_vacuum=args.sqlite_auto_vacuum,
+            journal_mode=args.sqlite_journal_mode,
+            synchronous=args.sqlite_synchronous,
+            busy_timeout_ms=args.sqlite_busy_timeout_ms,
+            mmap_size=args.sqlite_mmap_size,
+            cache_size=args.sqlite_cache_size,
+            temp_store=args.sqlite_temp_store,
+        ),
+    )
+
+
+def setup_app(
+    args: argparse.Namespace, db_instance: Database
+) -> BackgroundScheduler:
+    """
+    Starts the background services of a serving process and adds the
+    routers to the FastAPI application.
+    """
+    latest_prices.warm_up(db_instance, args.tickers, args.currencies)
+
+    # Only the serving processes are instrumented, the commands exit early
+    instrument_database(db_instance)
+    register_database_collector(db_instance)
+
+    # Initialize services
+    scheduler = init_services(args, db_instance)
+    app.add_event_handler("shutdown", lambda: shutdown_services(scheduler))
+
+    # Add routers to FastAPI application
+    app.include_router(
+        prices_router(
+            db_instance,
+            args.tickers,
+            args.currencies,
+            args.api_key,
+            next_fetch=lambda: next_fetch_time(scheduler),
+        ),
+    )
+    app.include_router(
+        health_router(
+            db_instance,
+            (
+                timedelta(minutes=args.max_data_age_mins)
+                if args.max_data_age_mins > 0
+                else None
+            ),
+        )
+    )
+    app.include_router(metrics_router())
+    app.add_middleware(MetricsMiddleware)
+    return scheduler
+
+
+def create_app() -> FastAPI:
+    """
+    Application factory of the worker processes started with --workers,
+    which import this module instead of running it. The database has been
+    prepared by the main process already.
+    """
+    args = get_arguments()
+    configure_logging(args)
+    setup_app(args, create_database(args))
+    return app
+
+
+if __name__ == "__main__":
+    global scheduler
+    args = get_arguments()
+    configure_logging(args)
+
     # Initialize the database
-    db_instance = Database(args.dir, args.name)
+    db_instance = create_database(args)
     db_instance.init_db()
 
-    # Initialize services
-    scheduler = init_services(args)
+    if args.command == "rebuild-rollups":
+        rebuild_rollups(db_instance)
+        sys.exit(0)
+
+    if args.command == "vacuum":
+        vacuum_db(db_instance)
+        sys.exit(0)
+
+    if args.command == "migrate-storage":
+        migrate_storage(db_instance, args.batch_size)
+        sys.exit(0)
+
+    if args.command == "backfill":
+        backfill_prices(
+            db_instance,
+            args.tickers,
+            args.currencies,
+            args.days,
+            # Bars are weighted against the fetched prices in averages
+            timedelta(minutes=int(args.fetch_interval_mins)),
+            interval=args.interval,
+        )
+        sys.exit(0)
+
+    if args.command == "export":
+        output = (
+            sys.stdout.buffer
+            if args.output == "-"
+            else open(args.output, "wb")
+        )
+        with output:
+            for chunk in export_prices(
+                db_instance,
+                ExportFormat(args.export_format),
+                ticker=args.export_ticker,
+                currencies=args.export_currencies,
+                start=to_utc(args.start) if args.start else None,
+                end=to_utc(args.end) if args.end else None,
+                batch_size=args.export_batch_size,
+            ):
+                output.write(chunk)
+        sys.exit(0)
+
+    check_layout(db_instance)
+    ensure_rollups(db_instance)
+
+    if args.workers > 1:
+        # Every worker serves requests, the one holding the leader lock
+        # also runs the background jobs. Their metrics are aggregated
+        # through files.
+        os.environ.setdefault(
+            MULTIPROC_DIR_ENV, tempfile.mkdtemp(prefix="prometheus-")
+        )
+        db_instance.engine.dispose()
+        uvicorn.run(
+            "main:create_app",
+            factory=True,
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+        )
+        sys.exit(0)
+
+    scheduler = setup_app(args, db_instance)
 
     # Register signal handlers for graceful shutdown
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
 
-    # Add routers to FastAPI application
-    app.include_router(
-        prices_router(db_instance, args.currencies, args.api_key),
-    )
-    app.include_router(health_router())
-
     uvicorn.run(app, host=args.host, port=args.port)
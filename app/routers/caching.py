@@ -0,0 +1,77 @@
+import hashlib
+import math
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request
+
+
+def make_etag(*parts: object, weak: bool = False) -> str:
+    """
+    Derives an entity tag from the parts identifying a response version.
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: Optional[datetime] = None
+) -> bool:
+    """
+    Evaluates the conditional request headers against the current version,
+    If-None-Match takes precedence over If-Modified-Since.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # Weak comparison, the only one allowed for If-None-Match
+        opaque_tag = etag.removeprefix("W/")
+        return any(
+            tag.strip().removeprefix("W/") == opaque_tag
+            for tag in if_none_match.split(",")
+        )
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have a resolution of one second
+        return as_utc(last_modified).replace(microsecond=0) <= since
+
+    return False
+
+
+def cache_headers(
+    etag: str,
+    last_modified: Optional[datetime] = None,
+    expires_at: Optional[datetime] = None,
+) -> Dict[str, str]:
+    """
+    Builds the validator and freshness headers of a cacheable response. It
+    stays fresh until expires_at (the next price fetch) and must be
+    revalidated without one.
+    """
+    headers = {"ETag": etag, "Vary": "api-key"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(
+            as_utc(last_modified), usegmt=True
+        )
+    if expires_at is not None:
+        remaining = (expires_at - datetime.now(timezone.utc)).total_seconds()
+        headers["Cache-Control"] = f"max-age={max(0, math.ceil(remaining))}"
+    else:
+        headers["Cache-Control"] = "no-cache"
+    return headers
+
+
+def as_utc(value: datetime) -> datetime:
+    """
+    Returns a timezone-aware datetime, naive ones are stored as UTC.
+    """
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
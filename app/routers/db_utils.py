@@ -1,33 +1,109 @@
 import logging
-from datetime import datetime, timezone, timedelta
-from typing import Dict, List
+from datetime import datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
 
-from database.models import BitcoinPrice
+import numpy as np
+from database.db import Database
+from database.layout import price_rows
+from database.models import DailyPriceRollup
+from database.types import EPOCH, PRICE_SCALE
 from fastapi import HTTPException
-from schemas.prices import AveragePriceDetail, PriceDetail
-from sqlalchemy import func
+from schemas.prices import (
+    AveragePriceDetail,
+    PriceDetail,
+    Resolution,
+    WindowStatsDetail,
+)
+from services.analytics import (
+    WindowStats,
+    compute_window_stats,
+    rolling_stats,
+)
+from services.downsampling import lttb
+from services.price_cache import latest_prices
+from sqlalchemy import (
+    Integer,
+    String,
+    case,
+    cast,
+    func,
+    select,
+    type_coerce,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+# Bucket sizes of the resolutions aggregated from the raw prices, daily
+# buckets are read from the rollups instead.
+RESOLUTION_SECS = {
+    Resolution.MINUTE: 60,
+    Resolution.FIVE_MINUTES: 5 * 60,
+    Resolution.HOUR: 60 * 60,
+}
+
+# Longer intraday ranges are aggregated in SQL instead of reading their raw
+# prices into memory
+MAX_RAW_HISTORY_SPAN = timedelta(days=7)
+
+# Intraday ranges holding more buckets per requested point are rejected,
+# downsampling would discard nearly all of them
+MAX_BUCKETS_PER_POINT = 100
+
+
+def get_cached_prices(
+    ticker: str, currencies: List[str], client_time: str
+) -> Optional[Dict[str, PriceDetail]]:
+    """
+    Retrieves the latest ticker prices for the specified currencies from the
+    in-memory cache, or None when the cache does not hold all of them yet.
+    """
+    cached = latest_prices.get(ticker, currencies)
+    if cached is None:
+        return None
+
+    return {
+        currency: PriceDetail(
+            price=record.price,
+            currency=currency,
+            request_time=client_time,
+            server_data_time=record.date.isoformat(),
+        )
+        for currency, record in cached.items()
+    }
+
 
 def get_latest_prices(
-    db: Session, currencies: List[str], client_time: str
+    db: Session,
+    db_instance: Database,
+    ticker: str,
+    currencies: List[str],
+    client_time: str,
 ) -> Dict[str, PriceDetail]:
     """
-    Retrieves the latest prices for the specified currencies from the database.
+    Retrieves the latest ticker prices for the specified currencies from the database.
     """
     logging.info(
-        f"Getting latest prices for currencies {currencies} from the database..."
+        f"Getting latest {ticker} prices for currencies {currencies} from the database..."
     )
+    stored = price_rows(db_instance)
     prices = {}
 
     for currency in currencies:
-        price_record = (
-            db.query(BitcoinPrice)
-            .filter(BitcoinPrice.currency == currency)
-            .order_by(BitcoinPrice.date.desc())
-            .first()
+        # Only indexed columns are selected, so this is answered by a single
+        # backwards seek into ix_bitcoin_prices_ticker_currency_date, or the
+        # primary key of compact_prices.
+        result = db.execute(
+            select(stored.c.price, stored.c.date)
+            .where(stored.c.ticker == ticker)
+            .where(stored.c.currency == currency)
+            .order_by(stored.c.date.desc())
+            .limit(1)
         )
+        price_record = result.first()
         if price_record:
+            latest_prices.publish(
+                ticker, currency, price_record.price, price_record.date
+            )
             data_time = price_record.date.isoformat()
             prices[currency] = PriceDetail(
                 price=price_record.price,
@@ -45,39 +121,39 @@ def get_latest_prices(
 
 
 def get_averages(
-    db: Session, currencies: List[str]
+    db: Session, ticker: str, currencies: List[str]
 ) -> Dict[str, AveragePriceDetail]:
     """
-    Retrieves the daily and monthly average prices for the specified currencies from the database.
+    Retrieves the daily and monthly average ticker prices for the specified currencies from the database.
     """
     logging.info(
-        f"Getting average prices for currencies {currencies} from the database..."
+        f"Getting average {ticker} prices for currencies {currencies} from the database..."
     )
     averages = {}
 
-    for currency in currencies:
-
-        # Calculate daily average
-        today = datetime.now(timezone.utc).date()
-        daily_start = datetime.combine(today, datetime.min.time())
-        daily_end = daily_start + timedelta(days=1)
-        daily_avg = (
-            db.query(func.avg(BitcoinPrice.price))
-            .filter(BitcoinPrice.currency == currency)
-            .filter(BitcoinPrice.date >= daily_start)
-            .filter(BitcoinPrice.date < daily_end)
-            .scalar()
-        )
+    today = datetime.now(timezone.utc).date()
+    first_day_of_month = today.replace(day=1)
+    is_today = DailyPriceRollup.day == today
 
-        # Calculate monthly average
-        first_day_of_month = today.replace(day=1)
-        monthly_avg = (
-            db.query(func.avg(BitcoinPrice.price))
-            .filter(BitcoinPrice.currency == currency)
-            .filter(BitcoinPrice.date >= first_day_of_month)
-            .filter(BitcoinPrice.date < daily_start)
-            .scalar()
+    for currency in currencies:
+        # Both averages come from the daily rollups, so this reads at most
+        # one bucket per day of the current month regardless of how many
+        # raw prices were stored.
+        result = db.execute(
+            select(
+                func.sum(case((is_today, DailyPriceRollup.price_sum))),
+                func.sum(case((is_today, DailyPriceRollup.price_weight))),
+                func.sum(case((~is_today, DailyPriceRollup.price_sum))),
+                func.sum(case((~is_today, DailyPriceRollup.price_weight))),
+            )
+            .where(DailyPriceRollup.ticker == ticker)
+            .where(DailyPriceRollup.currency == currency)
+            .where(DailyPriceRollup.day >= first_day_of_month)
+            .where(DailyPriceRollup.day <= today)
         )
+        daily_sum, daily_weight, monthly_sum, monthly_weight = result.one()
+        daily_avg = daily_sum / daily_weight if daily_weight else None
+        monthly_avg = monthly_sum / monthly_weight if monthly_weight else None
 
         if daily_avg is None and monthly_avg is None:
             raise HTTPException(
@@ -86,8 +162,338 @@ def get_averages(
             )
 
         averages[currency] = AveragePriceDetail(
-            daily_average=daily_avg if daily_avg is not None else None,
-            monthly_average=monthly_avg if monthly_avg is not None else None,
+            daily_average=daily_avg,
+            monthly_average=monthly_avg,
         )
 
     return averages
+
+
+async def get_price_history(
+    db: AsyncSession,
+    db_instance: Database,
+    ticker: str,
+    currency: str,
+    start: datetime,
+    end: datetime,
+    resolution: Resolution,
+    max_points: int,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Retrieves the OHLC buckets of the ticker prices in one currency between
+    start (inclusive) and end (exclusive), downsampled to at most max_points.
+    Returns the points and whether they were downsampled.
+    """
+    logging.info(
+        f"Getting {resolution.value} {ticker} price history in {currency} "
+        f"from {start.isoformat()} to {end.isoformat()}..."
+    )
+    if resolution == Resolution.DAY:
+        buckets = await get_daily_buckets(db, ticker, currency, start, end)
+    else:
+        bucket_count = (end - start).total_seconds() / RESOLUTION_SECS[
+            resolution
+        ]
+        if bucket_count > max_points * MAX_BUCKETS_PER_POINT:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many {resolution.value} buckets between start "
+                "and end, use a coarser resolution or a shorter range",
+            )
+        buckets = await get_intraday_buckets(
+            db,
+            db_instance,
+            ticker,
+            currency,
+            start,
+            end,
+            RESOLUTION_SECS[resolution],
+        )
+
+    # Buckets are downsampled on their averages before any of them is
+    # turned into a point, so long ranges only materialize max_points.
+    downsampled = len(buckets) > max_points
+    if downsampled:
+        buckets = buckets[lttb(buckets[:, 0], buckets[:, 5], max_points)]
+
+    return bucket_points(buckets), downsampled
+
+
+def bucket_points(buckets: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Turns (epoch seconds, open, high, low, close, average, count) rows into
+    OhlcPoint dicts. The buckets are computed from stored prices, so the
+    points are not validated as models, which would take longer than the
+    query for thousands of them.
+    """
+    # Bucket starts are whole seconds, formatted like naive isoformat()
+    times = np.datetime_as_string(buckets[:, 0].astype("datetime64[s]"))
+    return [
+        {
+            "time": bucket_time,
+            "open": open_price,
+            "high": high,
+            "low": low,
+            "close": close,
+            "average": average,
+            "count": int(count),
+        }
+        for bucket_time, (open_price, high, low, close, average, count) in zip(
+            times.tolist(), buckets[:, 1:].tolist()
+        )
+    ]
+
+
+async def get_daily_buckets(
+    db: AsyncSession,
+    ticker: str,
+    currency: str,
+    start: datetime,
+    end: datetime,
+) -> np.ndarray:
+    """
+    Reads whole-day buckets straight from the daily rollups. Returns one
+    (epoch seconds, open, high, low, close, average, count) row per day.
+    """
+    result = await db.execute(
+        select(
+            DailyPriceRollup.day,
+            DailyPriceRollup.price_first,
+            DailyPriceRollup.price_max,
+            DailyPriceRollup.price_min,
+            DailyPriceRollup.price_last,
+            DailyPriceRollup.price_sum / DailyPriceRollup.price_weight,
+            DailyPriceRollup.price_count,
+        )
+        .where(DailyPriceRollup.ticker == ticker)
+        .where(DailyPriceRollup.currency == currency)
+        .where(DailyPriceRollup.day >= start.date())
+        .where(DailyPriceRollup.day <= end.date())
+        .order_by(DailyPriceRollup.day)
+    )
+    return np.array(
+        [
+            (
+                datetime.combine(
+                    day, time.min, tzinfo=timezone.utc
+                ).timestamp(),
+                *values,
+            )
+            for day, *values in result.all()
+        ],
+        dtype=float,
+    ).reshape(-1, 7)
+
+
+async def read_prices(
+    db: AsyncSession,
+    db_instance: Database,
+    ticker: str,
+    currency: str,
+    start: datetime,
+    end: datetime,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads the prices of one currency between start (inclusive) and end
+    (exclusive) in date order. Returns their epoch seconds and prices as
+    arrays, the dates (and compact prices) are read raw and converted by
+    numpy rather than per row.
+    """
+    stored = price_rows(db_instance)
+    compact = db_instance.compact_storage
+    if compact:
+        columns = (
+            type_coerce(stored.c.date, Integer),
+            type_coerce(stored.c.price, Integer),
+        )
+    else:
+        columns = (type_coerce(stored.c.date, String), stored.c.price)
+    connection = await db.connection()
+    result = await connection.execute(
+        select(*columns)
+        .where(stored.c.ticker == ticker)
+        .where(stored.c.currency == currency)
+        .where(stored.c.date >= start)
+        .where(stored.c.date < end)
+        .order_by(stored.c.date)
+    )
+    rows = result.all()
+    if not rows:
+        return np.empty(0), np.empty(0)
+
+    dates, prices = zip(*rows)
+    prices = np.array(prices, dtype=float)
+    if compact:
+        return np.array(dates, dtype=np.int64) / 1e3, prices / PRICE_SCALE
+    seconds = np.array(dates, dtype="datetime64[us]").astype(np.int64) / 1e6
+    return seconds, prices
+
+
+async def get_intraday_buckets(
+    db: AsyncSession,
+    db_instance: Database,
+    ticker: str,
+    currency: str,
+    start: datetime,
+    end: datetime,
+    bucket_secs: int,
+) -> np.ndarray:
+    """
+    Aggregates the raw prices into fixed-size buckets. Returns one (epoch
+    seconds, open, high, low, close, average, count) row per bucket.
+    """
+    # The covering index already yields the prices in date order, so the
+    # buckets are contiguous runs that numpy reduces in a few vectorized
+    # passes. Grouping in SQL sorts every row in a temporary B-tree instead
+    # and is several times slower, but only the buckets leave SQLite, so
+    # long ranges are grouped there.
+    if end - start > MAX_RAW_HISTORY_SPAN:
+        return await aggregate_prices(
+            db, db_instance, ticker, currency, start, end, bucket_secs
+        )
+
+    seconds, prices = await read_prices(
+        db, db_instance, ticker, currency, start, end
+    )
+    if not len(prices):
+        return np.empty((0, 7))
+
+    buckets = seconds // bucket_secs
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(prices)])
+
+    return np.column_stack(
+        (
+            buckets[starts] * bucket_secs,
+            prices[starts],
+            np.maximum.reduceat(prices, starts),
+            np.minimum.reduceat(prices, starts),
+            prices[starts + counts - 1],
+            np.add.reduceat(prices, starts) / counts,
+            counts,
+        )
+    )
+
+
+async def aggregate_prices(
+    db: AsyncSession,
+    db_instance: Database,
+    ticker: str,
+    currency: str,
+    start: datetime,
+    end: datetime,
+    bucket_secs: int,
+) -> np.ndarray:
+    """
+    Aggregates the raw prices into fixed-size buckets in SQL. Returns one
+    (epoch seconds, open, high, low, close, average, count) row per bucket.
+    """
+    stored = price_rows(db_instance)
+    compact = db_instance.compact_storage
+    if compact:
+        date = type_coerce(stored.c.date, Integer)
+        seconds = date // 1000
+        price = type_coerce(stored.c.price, Integer)
+    else:
+        date = type_coerce(stored.c.date, String)
+        seconds = cast(func.strftime("%s", date), Integer)
+        price = stored.c.price
+
+    bucket = (seconds // bucket_secs).label("bucket")
+    buckets = (
+        select(
+            bucket,
+            func.min(date).label("first_date"),
+            func.max(date).label("last_date"),
+            func.max(price).label("high"),
+            func.min(price).label("low"),
+            # total() sums to a float, fixed-point sums could overflow
+            func.total(price).label("total"),
+            func.count().label("count"),
+        )
+        .where(stored.c.ticker == ticker)
+        .where(stored.c.currency == currency)
+        .where(stored.c.date >= start)
+        .where(stored.c.date < end)
+        .group_by(bucket)
+        .subquery()
+    )
+
+    def price_at(bucket_date) -> Any:
+        # A seek into the index (or primary key) per bucket
+        return (
+            select(price)
+            .where(stored.c.ticker == ticker)
+            .where(stored.c.currency == currency)
+            .where(date == bucket_date)
+            .limit(1)
+            .scalar_subquery()
+        )
+
+    result = await db.execute(
+        select(
+            buckets.c.bucket * bucket_secs,
+            price_at(buckets.c.first_date),
+            buckets.c.high,
+            buckets.c.low,
+            price_at(buckets.c.last_date),
+            buckets.c.total / buckets.c.count,
+            buckets.c.count,
+        ).order_by(buckets.c.bucket)
+    )
+    rows = np.array(result.all(), dtype=float).reshape(-1, 7)
+    if compact:
+        rows[:, 1:6] /= PRICE_SCALE
+    return rows
+
+
+def window_stats_detail(stats: WindowStats) -> WindowStatsDetail:
+    """
+    Turns window statistics into their response model.
+    """
+    return WindowStatsDetail(
+        **stats._replace(
+            start=(EPOCH + timedelta(seconds=stats.start)).isoformat(),
+            end=(EPOCH + timedelta(seconds=stats.end)).isoformat(),
+        )._asdict()
+    )
+
+
+async def get_window_stats(
+    db: AsyncSession,
+    db_instance: Database,
+    ticker: str,
+    currencies: List[str],
+    window: timedelta,
+) -> Tuple[Dict[str, WindowStatsDetail], bool]:
+    """
+    Retrieves the rolling statistics of the ticker prices over the window
+    ending now. Maintained windows are read from the running state, other
+    windows are computed from the stored prices. Returns the statistics
+    per currency and whether they were maintained.
+    """
+    logging.info(
+        f"Getting {ticker} analytics over {window} for currencies {currencies}..."
+    )
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    maintained = rolling_stats.maintains(window)
+    statistics = {}
+
+    for currency in currencies:
+        if maintained:
+            stats = rolling_stats.get(ticker, currency, window, now)
+        else:
+            seconds, prices = await read_prices(
+                db, db_instance, ticker, currency, now - window, now
+            )
+            stats = compute_window_stats(
+                seconds, prices, window.total_seconds()
+            )
+        if stats is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No price data available for {currency}",
+            )
+        statistics[currency] = window_stats_detail(stats)
+
+    return statistics, maintained
@@ -1,23 +1,76 @@
-from fastapi import APIRouter, status
+import logging
+from datetime import timedelta
+from typing import Optional
 
+from database.db import Database
+from fastapi import APIRouter, Response, status
+from services.metrics import get_data_age
+from sqlalchemy import text
 
-def health_router() -> APIRouter:
+
+def health_router(
+    db_instance: Database, max_data_age: Optional[timedelta] = None
+) -> APIRouter:
     """
-    Creates a router for the health check endpoint.
+    Creates a router for the liveness, health and readiness check endpoints.
+
+    Args:
+        db_instance (Database): The database instance to check readiness against.
+        max_data_age (Optional[timedelta]): Age of the newest price after which the
+                                            application is unhealthy, None to never
+                                            check it.
 
     Returns:
-        APIRouter: The configured FastAPI router for health check.
+        APIRouter: The configured FastAPI router for health and readiness checks.
     """
     router = APIRouter()
 
+    @router.get(
+        "/live",
+        status_code=status.HTTP_200_OK,
+        tags=["health"],
+        summary="Liveness Check",
+        description="Endpoint to check if the application process responds.",
+    )
+    async def liveness_check():
+        # Deliberately independent of the data and the price sources, a
+        # restart cannot fix an upstream outage
+        return {"status": "alive"}
+
     @router.get(
         "/health",
         status_code=status.HTTP_200_OK,
         tags=["health"],
         summary="Health Check",
         description="Endpoint to check if the application is running as expected.",
+        responses={503: {"description": "The prices are stale"}},
+    )
+    def health_check(response: Response):
+        data_age = get_data_age()
+        healthy = max_data_age is None or data_age <= max_data_age
+        if not healthy:
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {
+            "status": "healthy" if healthy else "unhealthy",
+            "data_age_secs": round(data_age.total_seconds()),
+        }
+
+    @router.get(
+        "/ready",
+        status_code=status.HTTP_200_OK,
+        tags=["health"],
+        summary="Readiness Check",
+        description="Endpoint to check if the application can serve prices from the database.",
+        responses={503: {"description": "The database cannot be queried"}},
     )
-    def health_check():
-        return {"status": "healthy"}
+    async def readiness_check(response: Response):
+        try:
+            async with db_instance.AsyncSessionLocal() as db:
+                await db.execute(text("SELECT 1"))
+        except Exception as e:
+            logging.error(f"Readiness check failed: {e}")
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            return {"status": "unavailable"}
+        return {"status": "ready"}
 
     return router
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from services.metrics import metrics_registry
+
+
+def metrics_router() -> APIRouter:
+    """
+    Creates a router exposing the Prometheus metrics.
+
+    Returns:
+        APIRouter: The configured FastAPI router for the metrics.
+    """
+    router = APIRouter()
+
+    @router.get(
+        "/metrics",
+        tags=["metrics"],
+        summary="Metrics",
+        description="Endpoint to scrape the Prometheus metrics of the application.",
+        response_class=Response,
+        responses={200: {"content": {CONTENT_TYPE_LATEST: {}}}},
+    )
+    def metrics() -> Response:
+        # Synchronous, the collectors query the database on scrape
+        return Response(
+            generate_latest(metrics_registry()),
+            media_type=CONTENT_TYPE_LATEST,
+        )
+
+    return router
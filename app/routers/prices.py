@@ -1,41 +1,125 @@
-from datetime import datetime
-from typing import List
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 from database.db import Database
-from fastapi import APIRouter, Depends, HTTPException, Request
-from schemas.prices import AveragesResponse, CurrentPricesResponse
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    status,
+)
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from schemas.prices import (
+    AnalyticsResponse,
+    AveragePriceDetail,
+    AveragesResponse,
+    CurrentPricesResponse,
+    ExportFormat,
+    HistoryResponse,
+    PriceDetail,
+    Resolution,
+)
+from services.analytics import rolling_stats
+from services.export import EXPORT_MEDIA_TYPES, export_prices
+from services.price_cache import latest_prices
+from services.price_stream import Subscriber, encode_prices, price_hub
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .db_utils import get_averages, get_latest_prices
+from .caching import cache_headers, is_not_modified, make_etag
+from .db_utils import (
+    get_averages,
+    get_cached_prices,
+    get_latest_prices,
+    get_price_history,
+    get_window_stats,
+)
+from .responses import JSON_MEDIA_TYPE, REQUEST_TIME_PLACEHOLDER, JSONTemplate
+
+# Upper bound of the points returned by the price history
+MAX_HISTORY_POINTS = 5000
+
+# Upper bound of the analytics windows computed from the stored prices
+MAX_ANALYTICS_WINDOW_MINS = 7 * 24 * 60
+
+# Interval of the comments keeping idle event streams open through proxies
+STREAM_HEARTBEAT_SECS = 15
+
+
+def to_utc(value: datetime) -> datetime:
+    """
+    Converts a timezone-aware datetime to the naive UTC form the prices are
+    stored in, naive datetimes are assumed to be UTC already.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
 
 
 def prices_router(
-    db_instance: Database, currencies: List[str], api_key: str
+    db_instance: Database,
+    tickers: List[str],
+    currencies: List[str],
+    api_key: str,
+    next_fetch: Optional[Callable[[], Optional[datetime]]] = None,
 ) -> APIRouter:
     """
     Creates a router for handling price-related endpoints with authentication and database dependencies.
 
     Args:
         db_instance (Database): The database instance.
+        tickers (List[str]): List of ticker symbols to handle, the first one is the default.
         currencies (List[str]): List of currency codes to handle.
         api_key (str): The API key for request authentication.
+        next_fetch (Optional[Callable]): Returns when prices are fetched next, responses
+                                         are cacheable until then.
 
     Returns:
         APIRouter: The configured FastAPI router.
     """
     router = APIRouter()
 
-    def get_db():
+    # Responses are encoded once per version of the cached prices and
+    # returned as bytes, FastAPI would otherwise validate and serialize the
+    # response models again on every request.
+    current_cache: Dict[str, Tuple[tuple, JSONTemplate]] = {}
+    averages_cache: Dict[str, Tuple[tuple, str, bytes]] = {}
+
+    def get_expiry() -> Optional[datetime]:
+        return next_fetch() if next_fetch is not None else None
+
+    # Dependencies and handlers are coroutines, so requests served from the
+    # caches never leave the event loop. The short queries behind them run
+    # on the synchronous engine in Starlette's threadpool, as local SQLite
+    # reads cost less than a round trip through the aiosqlite thread.
+
+    def read_latest_prices(
+        ticker: str, client_time: str
+    ) -> Dict[str, PriceDetail]:
+        with db_instance.session() as db:
+            return get_latest_prices(
+                db, db_instance, ticker, currencies, client_time
+            )
+
+    def read_averages(ticker: str) -> Dict[str, AveragePriceDetail]:
+        with db_instance.session() as db:
+            return get_averages(db, ticker, currencies)
+
+    async def get_db():
         """
-        Provides a database session for dependency injection.
+        Provides an asynchronous database session for dependency injection.
         """
-        db = next(db_instance.get_db())
-        try:
+        async for db in db_instance.get_async_db():
             yield db
-        finally:
-            db.close()
 
-    def authenticate(request: Request):
+    async def authenticate(request: Request):
         """
         Authenticates requests using the provided API key.
         """
@@ -43,6 +127,47 @@ def prices_router(
         if request_api_key != api_key:
             raise HTTPException(status_code=403, detail="Invalid API Key")
 
+    def is_authorized(connection: HTTPConnection) -> bool:
+        """
+        Checks the API key of a stream request. Browsers cannot set headers
+        on EventSource and WebSocket requests, so the key is also accepted
+        as the api_key query parameter.
+        """
+        return (
+            connection.headers.get("api-key")
+            or connection.query_params.get("api_key")
+        ) == api_key
+
+    async def authenticate_stream(request: Request):
+        """
+        Authenticates stream requests using the API key header or parameter.
+        """
+        if not is_authorized(request):
+            raise HTTPException(status_code=403, detail="Invalid API Key")
+
+    def get_snapshot(ticker: str) -> Optional[str]:
+        """
+        Encodes the cached prices sent to stream clients when they connect.
+        """
+        cached = latest_prices.get(ticker, currencies)
+        return encode_prices(ticker, cached) if cached is not None else None
+
+    async def get_ticker(
+        ticker: Optional[str] = Query(
+            None, description="Ticker symbol, defaults to the first configured"
+        )
+    ) -> str:
+        """
+        Resolves the requested ticker against the configured ones.
+        """
+        if ticker is None:
+            return tickers[0]
+        if ticker not in tickers:
+            raise HTTPException(
+                status_code=404, detail=f"Unsupported ticker {ticker}"
+            )
+        return ticker
+
     @router.get(
         "/prices/current",
         tags=["prices"],
@@ -51,22 +176,65 @@ def prices_router(
             200: {"description": "Successful Response"},
             403: {"description": "Invalid API Key"},
             404: {
-                "description": "No price data available for the requested currency"
+                "description": "Unsupported ticker or no price data available for the requested currency"
             },
         },
         description="Endpoint to get the current prices for specified currencies.",
     )
-    def current_prices(
+    async def current_prices(
         request: Request,
-        db: Session = Depends(get_db),
+        ticker: str = Depends(get_ticker),
         _: None = Depends(authenticate),
     ) -> CurrentPricesResponse:
         """
         Endpoint to get the current prices for specified currencies.
+        Served from the in-memory cache, falling back to the database while
+        the cache is cold. Cached prices carry a weak entity tag, as the
+        request time differs between otherwise equal responses.
         """
         client_time = datetime.now().isoformat()
-        prices = get_latest_prices(db, currencies, client_time)
-        return CurrentPricesResponse(prices=prices)
+        cached = latest_prices.get(ticker, currencies)
+        if cached is not None:
+            # Tagged by the prices and their dates rather than anything
+            # local to this process, so every worker and restart agrees
+            version = tuple(
+                (currency, record.price, record.date.isoformat())
+                for currency, record in sorted(cached.items())
+            )
+            etag = make_etag(ticker, version, weak=True)
+            last_modified = max(record.date for record in cached.values())
+            headers = cache_headers(etag, last_modified, get_expiry())
+            if is_not_modified(request, etag, last_modified):
+                return Response(status_code=304, headers=headers)
+
+            # cached_at is part of the body as well
+            key = (etag, latest_prices.updated_at)
+            entry = current_cache.get(ticker)
+            if entry is None or entry[0] != key:
+                prices = get_cached_prices(
+                    ticker, currencies, REQUEST_TIME_PLACEHOLDER
+                )
+                document = CurrentPricesResponse(
+                    ticker=ticker,
+                    prices=prices,
+                    cached_at=latest_prices.updated_at.isoformat(),
+                ).model_dump_json()
+                entry = (
+                    key,
+                    JSONTemplate(document.encode(), REQUEST_TIME_PLACEHOLDER),
+                )
+                current_cache[ticker] = entry
+
+            return Response(
+                content=entry[1].render(client_time),
+                media_type=JSON_MEDIA_TYPE,
+                headers=headers,
+            )
+
+        prices = await run_in_threadpool(
+            read_latest_prices, ticker, client_time
+        )
+        return CurrentPricesResponse(ticker=ticker, prices=prices)
 
     @router.get(
         "/prices/averages",
@@ -76,20 +244,330 @@ def prices_router(
             200: {"description": "Successful Response"},
             403: {"description": "Invalid API Key"},
             404: {
-                "description": "No price data available for the requested currency"
+                "description": "Unsupported ticker or no price data available for the requested currency"
             },
         },
         description="Endpoint to get the daily and monthly average prices for specified currencies.",
     )
-    def average_prices(
+    async def average_prices(
         request: Request,
-        db: Session = Depends(get_db),
+        ticker: str = Depends(get_ticker),
         _: None = Depends(authenticate),
     ) -> AveragesResponse:
         """
         Endpoint to get the daily and monthly average prices for specified currencies.
+        The averages only change when prices are stored or the day changes,
+        so their serialized form is reused until then.
+        """
+        version = latest_prices.version(ticker)
+        if not version:
+            # Nothing cached for the ticker yet, nothing to version by
+            averages = await run_in_threadpool(read_averages, ticker)
+            return AveragesResponse(ticker=ticker, averages=averages)
+
+        # The daily average starts over at midnight UTC. The entity tag is
+        # derived from the body, which a process following the fetching
+        # one may read from newer rollups than its cached prices.
+        today = datetime.now(timezone.utc).date()
+        key = (version, today)
+        cached = averages_cache.get(ticker)
+        if cached is None or cached[0] != key:
+            averages = await run_in_threadpool(read_averages, ticker)
+            body = (
+                AveragesResponse(ticker=ticker, averages=averages)
+                .model_dump_json()
+                .encode()
+            )
+            cached = averages_cache[ticker] = (key, make_etag(body), body)
+        _, etag, body = cached
+
+        headers = cache_headers(etag, expires_at=get_expiry())
+        if is_not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+
+        return Response(
+            content=body, media_type=JSON_MEDIA_TYPE, headers=headers
+        )
+
+    @router.get(
+        "/prices/history",
+        tags=["prices"],
+        response_model=HistoryResponse,
+        responses={
+            200: {"description": "Successful Response"},
+            400: {"description": "Invalid time range or too many buckets"},
+            403: {"description": "Invalid API Key"},
+            404: {"description": "Unsupported ticker or currency"},
+        },
+        description="Endpoint to get the OHLC price history of a currency over a time range.",
+    )
+    async def price_history(
+        request: Request,
+        currency: str = Query(..., description="Currency code of the prices"),
+        start: Optional[datetime] = Query(
+            None,
+            description="Start of the range, defaults to a day before end",
+        ),
+        end: Optional[datetime] = Query(
+            None, description="End of the range (exclusive), defaults to now"
+        ),
+        resolution: Resolution = Query(
+            Resolution.HOUR, description="Bucket size of the points"
+        ),
+        max_points: int = Query(
+            500,
+            ge=3,
+            le=MAX_HISTORY_POINTS,
+            description="Maximum number of points, larger series are downsampled",
+        ),
+        ticker: str = Depends(get_ticker),
+        db: AsyncSession = Depends(get_db),
+        _: None = Depends(authenticate),
+    ) -> HistoryResponse:
+        """
+        Endpoint to get the OHLC price history of a currency over a time range.
+        Daily buckets are served from the rollups and cover whole days, finer
+        buckets are aggregated from the stored prices.
+        """
+        if currency not in currencies:
+            raise HTTPException(
+                status_code=404, detail=f"Unsupported currency {currency}"
+            )
+
+        end = (
+            to_utc(end)
+            if end
+            else datetime.now(timezone.utc).replace(tzinfo=None)
+        )
+        start = to_utc(start) if start else end - timedelta(days=1)
+        if start >= end:
+            raise HTTPException(
+                status_code=400, detail="start must be before end"
+            )
+
+        points, downsampled = await get_price_history(
+            db,
+            db_instance,
+            ticker,
+            currency,
+            start,
+            end,
+            resolution,
+            max_points,
+        )
+        # Encoded straight from the computed points, HistoryResponse only
+        # documents the shape
+        return ORJSONResponse(
+            {
+                "ticker": ticker,
+                "currency": currency,
+                "resolution": resolution.value,
+                "downsampled": downsampled,
+                "points": points,
+            }
+        )
+
+    @router.get(
+        "/prices/analytics",
+        tags=["prices"],
+        response_model=AnalyticsResponse,
+        responses={
+            200: {"description": "Successful Response"},
+            400: {"description": "Window too long to compute"},
+            403: {"description": "Invalid API Key"},
+            404: {
+                "description": "Unsupported ticker or no price data available for the requested currency"
+            },
+        },
+        description="Endpoint to get rolling statistics of the prices over a trailing window: moving averages, "
+        "extremes, deviation, volatility and change.",
+    )
+    async def analytics(
+        request: Request,
+        window_mins: float = Query(
+            60, gt=0, description="Length of the window ending now"
+        ),
+        ticker: str = Depends(get_ticker),
+        db: AsyncSession = Depends(get_db),
+        _: None = Depends(authenticate),
+    ) -> AnalyticsResponse:
+        """
+        Endpoint to get rolling statistics of the prices over a trailing window.
+        The configured windows are maintained as prices are stored, other
+        windows are computed from the stored prices and limited in length.
+        """
+        window = timedelta(minutes=window_mins)
+        if (
+            not rolling_stats.maintains(window)
+            and window_mins > MAX_ANALYTICS_WINDOW_MINS
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Windows longer than {MAX_ANALYTICS_WINDOW_MINS} "
+                "minutes are not supported",
+            )
+
+        statistics, maintained = await get_window_stats(
+            db, db_instance, ticker, currencies, window
+        )
+        return AnalyticsResponse(
+            ticker=ticker,
+            window_mins=window_mins,
+            maintained=maintained,
+            statistics=statistics,
+        )
+
+    @router.get(
+        "/prices/export",
+        tags=["prices"],
+        response_class=StreamingResponse,
+        responses={
+            200: {
+                "description": "Successful Response",
+                "content": {
+                    media_type: {}
+                    for media_type in EXPORT_MEDIA_TYPES.values()
+                },
+            },
+            403: {"description": "Invalid API Key"},
+            404: {"description": "Unsupported ticker"},
+        },
+        description="Endpoint to stream the stored prices of a ticker as NDJSON, CSV or Parquet.",
+    )
+    async def export(
+        request: Request,
+        export_format: ExportFormat = Query(
+            ExportFormat.NDJSON, alias="format", description="Output format"
+        ),
+        currency: Optional[List[str]] = Query(
+            None, description="Currency codes to export, defaults to all"
+        ),
+        start: Optional[datetime] = Query(
+            None, description="Start of the range, defaults to the first price"
+        ),
+        end: Optional[datetime] = Query(
+            None, description="End of the range (exclusive), defaults to now"
+        ),
+        ticker: str = Depends(get_ticker),
+        _: None = Depends(authenticate),
+    ) -> StreamingResponse:
+        """
+        Endpoint to stream the stored prices of a ticker as NDJSON, CSV or Parquet.
+        Rows are read with a server-side cursor and encoded chunk by chunk,
+        Starlette iterates the synchronous stream in its threadpool.
         """
-        averages = get_averages(db, currencies)
-        return AveragesResponse(averages=averages)
+        filename = f"{ticker.lower()}-prices.{export_format.value}"
+        return StreamingResponse(
+            export_prices(
+                db_instance,
+                export_format,
+                ticker=ticker,
+                currencies=currency,
+                start=to_utc(start) if start else None,
+                end=to_utc(end) if end else None,
+            ),
+            media_type=EXPORT_MEDIA_TYPES[export_format],
+            headers={
+                "Content-Disposition": f'attachment; filename="{filename}"'
+            },
+        )
+
+    @router.get(
+        "/prices/stream",
+        tags=["prices"],
+        response_class=StreamingResponse,
+        responses={
+            200: {
+                "description": "Successful Response",
+                "content": {"text/event-stream": {}},
+            },
+            403: {"description": "Invalid API Key"},
+            404: {"description": "Unsupported ticker"},
+        },
+        description="Endpoint to stream the prices of a ticker as Server-Sent Events whenever they are fetched. "
+        "The same messages are served over a WebSocket on this path.",
+    )
+    async def stream_prices(
+        request: Request,
+        ticker: str = Depends(get_ticker),
+        _: None = Depends(authenticate_stream),
+    ) -> StreamingResponse:
+        """
+        Endpoint to stream the prices of a ticker as Server-Sent Events.
+        The cached prices are sent on connect, then every fetched update.
+        """
+
+        async def events() -> AsyncIterator[str]:
+            with price_hub.subscribe(ticker) as subscriber:
+                snapshot = get_snapshot(ticker)
+                if snapshot is not None:
+                    yield f"data: {snapshot}\n\n"
+                while True:
+                    try:
+                        message = await asyncio.wait_for(
+                            subscriber.get(), STREAM_HEARTBEAT_SECS
+                        )
+                    except asyncio.TimeoutError:
+                        yield ": keep-alive\n\n"
+                        continue
+                    if message is None:
+                        yield "event: dropped\ndata: slow consumer\n\n"
+                        return
+                    yield f"data: {message}\n\n"
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @router.websocket("/prices/stream")
+    async def stream_prices_websocket(
+        websocket: WebSocket, ticker: Optional[str] = None
+    ) -> None:
+        """
+        Endpoint to stream the prices of a ticker over a WebSocket.
+        The cached prices are sent on connect, then every fetched update.
+        """
+        ticker = ticker or tickers[0]
+        if not is_authorized(websocket) or ticker not in tickers:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        await websocket.accept()
+
+        async def forward(subscriber: Subscriber) -> None:
+            snapshot = get_snapshot(ticker)
+            if snapshot is not None:
+                await websocket.send_text(snapshot)
+            while (message := await subscriber.get()) is not None:
+                await websocket.send_text(message)
+            await websocket.close(
+                code=status.WS_1013_TRY_AGAIN_LATER, reason="Slow consumer"
+            )
+
+        async def wait_for_disconnect() -> None:
+            # Incoming messages are ignored, the stream is one way
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+
+        with price_hub.subscribe(ticker) as subscriber:
+            tasks = {
+                asyncio.ensure_future(forward(subscriber)),
+                asyncio.ensure_future(wait_for_disconnect()),
+            }
+            done, pending = await asyncio.wait(
+                tasks, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in pending:
+                task.cancel()
+            # Retrieve the outcome of the finished task, e.g. a send to a
+            # client that has just gone away
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    logging.debug(
+                        f"{ticker} stream closed: {task.exception()!r}"
+                    )
 
     return router
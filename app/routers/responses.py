@@ -0,0 +1,22 @@
+from typing import Any, List
+
+import orjson
+
+JSON_MEDIA_TYPE = "application/json"
+
+# Stands in for the request time of pre-encoded current prices
+REQUEST_TIME_PLACEHOLDER = "<request_time>"
+
+
+class JSONTemplate:
+    """
+    A JSON document encoded once, with every occurrence of a placeholder
+    string filled in per response. Rendering joins pre-encoded bytes, so
+    responses that differ in a single value are not serialized again.
+    """
+
+    def __init__(self, document: bytes, placeholder: str) -> None:
+        self._parts: List[bytes] = document.split(orjson.dumps(placeholder))
+
+    def render(self, value: Any) -> bytes:
+        return orjson.dumps(value).join(self._parts)
@@ -1,4 +1,5 @@
-from typing import Dict, Optional
+from enum import Enum
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel
 
@@ -8,7 +9,7 @@ class PriceDetail(BaseModel):
     Model to represent detailed information about a specific price.
 
     Attributes:
-        price (float): The price of Bitcoin in the specified currency.
+        price (float): The price of the ticker in the specified currency.
         currency (str): The currency code (e.g., 'EUR', 'CZK').
         request_time (str): The time the client made the request.
         server_data_time (str): The time the price data was recorded on the server.
@@ -25,12 +26,17 @@ class CurrentPricesResponse(BaseModel):
     Model to represent the response containing the latest prices for multiple currencies.
 
     Attributes:
+        ticker (str): The ticker symbol the prices belong to (e.g., 'BTC-USD').
         prices (Dict[str, PriceDetail]): A dictionary where the keys are currency codes
                                          and the values are PriceDetail objects containing
                                          the latest price information for each currency.
+        cached_at (Optional[str]): The time the in-memory price cache was last updated.
+                                   This is None when the prices were read from the database.
     """
 
+    ticker: str
     prices: Dict[str, PriceDetail]
+    cached_at: Optional[str] = None
 
 
 class AveragePriceDetail(BaseModel):
@@ -53,9 +59,129 @@ class AveragesResponse(BaseModel):
     Model to represent the response containing the average prices for multiple currencies.
 
     Attributes:
+        ticker (str): The ticker symbol the averages belong to (e.g., 'BTC-USD').
         averages (Dict[str, AveragePriceDetail]): A dictionary where the keys are currency codes
                                                   and the values are AveragePriceDetail objects
                                                   containing the average price information for each currency.
     """
 
+    ticker: str
     averages: Dict[str, AveragePriceDetail]
+
+
+class Resolution(str, Enum):
+    """
+    Bucket sizes supported by the price history.
+    """
+
+    MINUTE = "1m"
+    FIVE_MINUTES = "5m"
+    HOUR = "1h"
+    DAY = "1d"
+
+
+class ExportFormat(str, Enum):
+    """
+    Encodings supported by the price export.
+    """
+
+    NDJSON = "ndjson"
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
+class OhlcPoint(BaseModel):
+    """
+    Model to represent the prices aggregated into one history bucket.
+
+    Attributes:
+        time (str): The start of the bucket.
+        open (float): The first price recorded in the bucket.
+        high (float): The highest price recorded in the bucket.
+        low (float): The lowest price recorded in the bucket.
+        close (float): The last price recorded in the bucket.
+        average (float): The average of the prices recorded in the bucket.
+        count (int): The number of prices recorded in the bucket.
+    """
+
+    time: str
+    open: float
+    high: float
+    low: float
+    close: float
+    average: float
+    count: int
+
+
+class HistoryResponse(BaseModel):
+    """
+    Model to represent the price history of a ticker in one currency.
+
+    Attributes:
+        ticker (str): The ticker symbol the prices belong to (e.g., 'BTC-USD').
+        currency (str): The currency code of the prices (e.g., 'EUR').
+        resolution (Resolution): The bucket size of the points.
+        downsampled (bool): Whether the buckets were reduced to the requested
+                            maximum number of points.
+        points (List[OhlcPoint]): The buckets ordered by time.
+    """
+
+    ticker: str
+    currency: str
+    resolution: Resolution
+    downsampled: bool
+    points: List[OhlcPoint]
+
+
+class WindowStatsDetail(BaseModel):
+    """
+    Model to represent the rolling statistics of the prices in one currency.
+
+    Attributes:
+        count (int): The number of prices in the window.
+        start (str): The time of the oldest price in the window.
+        end (str): The time of the newest price in the window.
+        last (float): The newest price.
+        sma (float): The simple moving average of the prices.
+        ema (float): The exponential moving average, weights halve every quarter of the window.
+        twap (Optional[float]): The time-weighted average price, each price weighted by how
+                                long it was the latest. None for a single price.
+        min (float): The lowest price in the window.
+        max (float): The highest price in the window.
+        stddev (Optional[float]): The sample standard deviation of the prices.
+        volatility_pct (Optional[float]): The sample standard deviation of the log returns
+                                          between consecutive prices, in percent.
+        change_pct (float): The change from the oldest to the newest price, in percent.
+    """
+
+    count: int
+    start: str
+    end: str
+    last: float
+    sma: float
+    ema: float
+    twap: Optional[float]
+    min: float
+    max: float
+    stddev: Optional[float]
+    volatility_pct: Optional[float]
+    change_pct: float
+
+
+class AnalyticsResponse(BaseModel):
+    """
+    Model to represent the rolling statistics of a ticker over a trailing window.
+
+    Attributes:
+        ticker (str): The ticker symbol the statistics belong to (e.g., 'BTC-USD').
+        window_mins (float): The length of the window ending now, in minutes.
+        maintained (bool): Whether the statistics were kept up to date as prices were
+                           stored, rather than computed from the stored prices.
+        statistics (Dict[str, WindowStatsDetail]): A dictionary where the keys are currency
+                                                   codes and the values are the statistics.
+    """
+
+    ticker: str
+    window_mins: float
+    maintained: bool
+    statistics: Dict[str, WindowStatsDetail]
@@ -0,0 +1,338 @@
+import logging
+import math
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from database.db import Database
+from database.layout import price_rows
+from database.types import EPOCH
+from sqlalchemy import select
+
+# The EMA halves the weight of a price every quarter of the window, so the
+# oldest prices of a window weigh 1/16 of the newest
+EMA_HALFLIVES_PER_WINDOW = 4
+
+# Running EMA weights are rebased before exp() gets anywhere near overflow
+MAX_EMA_EXPONENT = 50.0
+
+
+class WindowStats(NamedTuple):
+    """
+    Statistics of the prices in a trailing window, times are naive UTC
+    epoch seconds. Values needing more prices than the window holds are
+    None.
+    """
+
+    count: int
+    start: float
+    end: float
+    last: float
+    sma: float
+    ema: float
+    twap: Optional[float]
+    min: float
+    max: float
+    stddev: Optional[float]
+    volatility_pct: Optional[float]
+    change_pct: float
+
+
+def to_seconds(date: datetime) -> float:
+    return (date - EPOCH).total_seconds()
+
+
+def ema_rate(window_secs: float) -> float:
+    """
+    Returns the decay of the EMA weights per second of the window.
+    """
+    return math.log(2) * EMA_HALFLIVES_PER_WINDOW / window_secs
+
+
+def sample_stddev(total: float, squares: float, count: int) -> float:
+    return math.sqrt(max(squares - total * total / count, 0) / (count - 1))
+
+
+def compute_window_stats(
+    seconds: np.ndarray, prices: np.ndarray, window_secs: float
+) -> Optional[WindowStats]:
+    """
+    Computes the statistics of ordered prices of one series, all inside the
+    window, in a few vectorized passes. Returns None without prices.
+    """
+    count = len(prices)
+    if not count:
+        return None
+
+    weights = np.exp((seconds - seconds[-1]) * ema_rate(window_secs))
+    durations = np.diff(seconds)
+    held = durations.sum()
+    returns = np.diff(np.log(prices))
+    return WindowStats(
+        count=count,
+        start=float(seconds[0]),
+        end=float(seconds[-1]),
+        last=float(prices[-1]),
+        sma=float(prices.mean()),
+        ema=float(weights @ prices / weights.sum()),
+        twap=float(prices[:-1] @ durations / held) if held > 0 else None,
+        min=float(prices.min()),
+        max=float(prices.max()),
+        stddev=float(prices.std(ddof=1)) if count > 1 else None,
+        volatility_pct=(
+            float(returns.std(ddof=1)) * 100 if count > 2 else None
+        ),
+        change_pct=float(prices[-1] / prices[0] - 1) * 100,
+    )
+
+
+class RollingWindow:
+    """
+    Running statistics of one series over a trailing window. Every price
+    is added and expired once, sums are kept for the averages and
+    deviations and monotonic queues for the extremes, so updates and reads
+    take amortized constant time.
+    """
+
+    def __init__(self, window_secs: float) -> None:
+        self.window_secs = window_secs
+        self.rate = ema_rate(window_secs)
+        # (time, price) of the prices in the window, oldest first
+        self.points: Deque[Tuple[float, float]] = deque()
+        # (time, price) candidates for the minimum and maximum
+        self.lows: Deque[Tuple[float, float]] = deque()
+        self.highs: Deque[Tuple[float, float]] = deque()
+        self._reset_sums()
+
+    def _reset_sums(self) -> None:
+        # Prices are summed relative to the oldest one, so the squares do
+        # not lose the digits the deviation is made of
+        self.shift = self.points[0][1] if self.points else 0.0
+        self.ema_origin = self.points[0][0] if self.points else 0.0
+        self.total = self.squares = 0.0
+        self.ema_total = self.ema_weight = 0.0
+        # Of consecutive pairs: price times duration, log return, its square
+        self.held_total = 0.0
+        self.return_total = self.return_squares = 0.0
+        self.removed = 0
+
+        previous = None
+        for point in self.points:
+            self._add_point(point, 1.0)
+            if previous is not None:
+                self._add_pair(previous, point, 1.0)
+            previous = point
+
+    def _add_point(self, point: Tuple[float, float], sign: float) -> None:
+        time, price = point
+        shifted = price - self.shift
+        self.total += sign * shifted
+        self.squares += sign * shifted * shifted
+        weight = math.exp((time - self.ema_origin) * self.rate)
+        self.ema_total += sign * weight * price
+        self.ema_weight += sign * weight
+
+    def _add_pair(
+        self,
+        previous: Tuple[float, float],
+        point: Tuple[float, float],
+        sign: float,
+    ) -> None:
+        ratio = math.log(point[1] / previous[1])
+        self.held_total += sign * previous[1] * (point[0] - previous[0])
+        self.return_total += sign * ratio
+        self.return_squares += sign * ratio * ratio
+
+    def add(self, time: float, price: float) -> None:
+        """
+        Adds a price, prices older than the newest one are ignored.
+        """
+        if self.points and time < self.points[-1][0]:
+            return
+        self.expire(time)
+
+        point = (time, price)
+        previous = self.points[-1] if self.points else None
+        self.points.append(point)
+        if (
+            previous is None
+            or (time - self.ema_origin) * self.rate > MAX_EMA_EXPONENT
+        ):
+            self._reset_sums()
+        else:
+            self._add_point(point, 1.0)
+            self._add_pair(previous, point, 1.0)
+
+        while self.lows and self.lows[-1][1] >= price:
+            self.lows.pop()
+        self.lows.append(point)
+        while self.highs and self.highs[-1][1] <= price:
+            self.highs.pop()
+        self.highs.append(point)
+
+    def expire(self, now: float) -> None:
+        """
+        Drops the prices that left the window ending at now.
+        """
+        cutoff = now - self.window_secs
+        while self.points and self.points[0][0] < cutoff:
+            point = self.points.popleft()
+            self._add_point(point, -1.0)
+            # The pair of the dropped price and its successor goes as well
+            if self.points:
+                self._add_pair(point, self.points[0], -1.0)
+            self.removed += 1
+        while self.lows and self.lows[0][0] < cutoff:
+            self.lows.popleft()
+        while self.highs and self.highs[0][0] < cutoff:
+            self.highs.popleft()
+        # Subtracting accumulates rounding errors, the sums are recomputed
+        # once per window's worth of removed prices
+        if self.removed > len(self.points):
+            self._reset_sums()
+
+    def stats(self, now: float) -> Optional[WindowStats]:
+        """
+        Returns the statistics of the window ending at now, None when it
+        holds no price.
+        """
+        self.expire(now)
+        count = len(self.points)
+        if not count:
+            return None
+
+        (start, first), (end, last) = self.points[0], self.points[-1]
+        held = end - start
+        return WindowStats(
+            count=count,
+            start=start,
+            end=end,
+            last=last,
+            sma=self.shift + self.total / count,
+            ema=self.ema_total / self.ema_weight,
+            twap=self.held_total / held if held > 0 else None,
+            min=self.lows[0][1],
+            max=self.highs[0][1],
+            stddev=(
+                sample_stddev(self.total, self.squares, count)
+                if count > 1
+                else None
+            ),
+            volatility_pct=(
+                sample_stddev(
+                    self.return_total, self.return_squares, count - 1
+                )
+                * 100
+                if count > 2
+                else None
+            ),
+            change_pct=(last / first - 1) * 100,
+        )
+
+
+class RollingStats:
+    """
+    Rolling windows of every ticker/currency, maintained as prices are
+    stored instead of scanning the history on every request. Windows that
+    are not configured are computed from the stored prices instead.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._window_secs: List[float] = []
+        self._series: Dict[Tuple[str, str], Dict[float, RollingWindow]] = {}
+        self._newest: Dict[Tuple[str, str], datetime] = {}
+
+    def configure(self, windows: List[timedelta]) -> None:
+        """
+        Sets the maintained windows, dropping the running state.
+        """
+        with self._lock:
+            self._window_secs = sorted(
+                {window.total_seconds() for window in windows}
+            )
+            self._series = {}
+            self._newest = {}
+
+    def maintains(self, window: timedelta) -> bool:
+        return window.total_seconds() in self._window_secs
+
+    def add(
+        self, ticker: str, currency: str, price: float, date: datetime
+    ) -> None:
+        if not self._window_secs:
+            return
+        time = to_seconds(date)
+        with self._lock:
+            windows = self._series.get((ticker, currency))
+            if windows is None:
+                windows = self._series[(ticker, currency)] = {
+                    window_secs: RollingWindow(window_secs)
+                    for window_secs in self._window_secs
+                }
+            for window in windows.values():
+                window.add(time, price)
+            newest = self._newest.get((ticker, currency))
+            if newest is None or date > newest:
+                self._newest[(ticker, currency)] = date
+
+    def get(
+        self, ticker: str, currency: str, window: timedelta, now: datetime
+    ) -> Optional[WindowStats]:
+        """
+        Returns the statistics of a maintained window ending at now, None
+        when the series has no price in it.
+        """
+        with self._lock:
+            windows = self._series.get((ticker, currency), {})
+            rolling = windows.get(window.total_seconds())
+            return rolling.stats(to_seconds(now)) if rolling else None
+
+    def load(
+        self,
+        db_instance: Database,
+        tickers: List[str],
+        currencies: List[str],
+        reload: bool = False,
+    ) -> None:
+        """
+        Adds the stored prices newer than the ones already added, or those
+        of the longest window when there are none yet (or on reload). Used
+        on startup, by processes following the fetching one and after
+        older prices were backfilled.
+        """
+        if not self._window_secs:
+            return
+        if reload:
+            self.configure(
+                [timedelta(seconds=secs) for secs in self._window_secs]
+            )
+
+        prices = price_rows(db_instance)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        oldest = now - timedelta(seconds=self._window_secs[-1])
+        loaded = 0
+        with db_instance.session() as db:
+            for ticker in tickers:
+                for currency in currencies:
+                    newest = self._newest.get((ticker, currency))
+                    stmt = (
+                        select(prices.c.date, prices.c.price)
+                        .where(prices.c.ticker == ticker)
+                        .where(prices.c.currency == currency)
+                        .order_by(prices.c.date)
+                    )
+                    if newest is None:
+                        stmt = stmt.where(prices.c.date >= oldest)
+                    else:
+                        stmt = stmt.where(prices.c.date > newest)
+                    for date, price in db.execute(stmt):
+                        self.add(ticker, currency, price, date)
+                        loaded += 1
+        logging.debug(f"Loaded {loaded} prices into the rolling windows")
+
+
+# Process-wide rolling windows updated with every stored price
+rolling_stats = RollingStats()
@@ -0,0 +1,52 @@
+from datetime import timedelta
+from typing import List, Optional
+
+from database.db import Database
+
+# Bar length, longest span served per request and how far back Yahoo
+# Finance keeps each interval (None for no limit).
+INTERVAL_LIMITS = {
+    "1m": (timedelta(minutes=1), timedelta(days=7), timedelta(days=29)),
+    "5m": (timedelta(minutes=5), timedelta(days=59), timedelta(days=59)),
+    "1h": (timedelta(hours=1), timedelta(days=729), timedelta(days=729)),
+    "1d": (timedelta(days=1), None, None),
+}
+BACKFILL_INTERVALS = list(INTERVAL_LIMITS)
+
+
+def choose_interval(days: float) -> str:
+    """
+    Returns the finest bar interval Yahoo Finance keeps for the last `days`.
+    """
+    for interval, (_, _, history) in INTERVAL_LIMITS.items():
+        if history is None or timedelta(days=days) < history:
+            return interval
+    return BACKFILL_INTERVALS[-1]
+
+
+def backfill_prices(
+    db_instance: Database,
+    tickers: List[str],
+    currencies: List[str],
+    days: float,
+    fetch_interval: timedelta,
+    interval: Optional[str] = None,
+) -> int:
+    """
+    Loads the last `days` of ticker history converted into every currency,
+    at the finest interval available unless one is given. The bars are
+    weighted against the prices fetched every `fetch_interval` in the
+    averages. Returns the number of prices stored.
+    """
+    # The loader needs pandas and yfinance, which are only imported once
+    # history is actually loaded
+    from services.history import load_history
+
+    return load_history(
+        db_instance,
+        tickers,
+        currencies,
+        days,
+        interval or choose_interval(days),
+        fetch_interval,
+    )
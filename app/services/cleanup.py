@@ -1,15 +1,116 @@
 import logging
+import time
 from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple
 
 from database.db import Database
-from database.models import BitcoinPrice
+from database.models import (
+    BitcoinPrice,
+    CompactPrice,
+    DailyPriceRollup,
+    PriceSeries,
+)
+from services.maintenance import incremental_vacuum
+from services.metrics import CLEANUP_DELETED
+from sqlalchemy import Delete, delete, select
+from sqlalchemy.orm import Session
 
 
-def cleanup_db_data(db_dir: str, db_name: str, retention_days: int) -> None:
-    logging.info(f"Cleaning up database {db_dir}/{db_name} data")
-    db_instance = Database(db_dir, db_name)
-    db = next(db_instance.get_db())
+class CleanupResult(NamedTuple):
+    rows_deleted: int
+    batches: int
+    elapsed_secs: float
+    complete: bool
 
+
+def expired_deletes(
+    db: Session, db_instance: Database, final_date: datetime, batch_size: int
+) -> List[Delete]:
+    """
+    Returns the statements deleting one batch of the prices older than
+    final_date, each to be repeated until it deletes less than a batch.
+    """
+    if not db_instance.compact_storage:
+        expired = (
+            select(BitcoinPrice.id)
+            .where(BitcoinPrice.date < final_date)
+            .order_by(BitcoinPrice.date)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        return [delete(BitcoinPrice).where(BitcoinPrice.id.in_(expired))]
+
+    # The compact primary key is only ordered by date within a series, so
+    # every series gets its own batches, each a range seek of the key.
+    statements = []
+    for series_id in db.scalars(select(PriceSeries.id)).all():
+        expired = (
+            select(CompactPrice.ts)
+            .where(CompactPrice.series_id == series_id)
+            .where(CompactPrice.ts < final_date)
+            .order_by(CompactPrice.ts)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        statements.append(
+            delete(CompactPrice)
+            .where(CompactPrice.series_id == series_id)
+            .where(CompactPrice.ts.in_(expired))
+        )
+    return statements
+
+
+def cleanup_db_data(
+    db_instance: Database,
+    retention_days: int,
+    batch_size: int = 5000,
+    time_budget_secs: float = 2.0,
+    vacuum_pages: int = 0,
+) -> CleanupResult:
+    """
+    Deletes prices older than the retention period in bounded batches.
+
+    Each batch is its own short transaction found through the date index, so
+    readers and the fetch writer only ever wait for a single batch. Once the
+    time budget is spent the remaining rows are left for the next run.
+    """
+    logging.info(
+        f"Cleaning up database {db_instance.db_dir}/{db_instance.db_name} data"
+    )
+    started = time.perf_counter()
     final_date = datetime.now(timezone.utc) - timedelta(days=retention_days)
-    db.query(BitcoinPrice).filter(BitcoinPrice.date < final_date).delete()
-    db.commit()
+
+    rows_deleted = 0
+    batches = 0
+    with db_instance.session() as db:
+        db.query(DailyPriceRollup).filter(
+            DailyPriceRollup.day < final_date.date()
+        ).delete()
+        db.commit()
+
+        statements = expired_deletes(db, db_instance, final_date, batch_size)
+        while statements and time.perf_counter() - started < time_budget_secs:
+            deleted = db.execute(statements[0]).rowcount
+            db.commit()
+            rows_deleted += deleted
+            batches += 1
+            if deleted < batch_size:
+                statements.pop(0)
+        complete = not statements
+
+    if vacuum_pages and rows_deleted:
+        incremental_vacuum(db_instance, vacuum_pages)
+
+    result = CleanupResult(
+        rows_deleted=rows_deleted,
+        batches=batches,
+        elapsed_secs=time.perf_counter() - started,
+        complete=complete,
+    )
+    CLEANUP_DELETED.inc(result.rows_deleted)
+    logging.info(
+        f"Deleted {result.rows_deleted} expired prices in {result.batches} "
+        f"batches ({result.elapsed_secs:.3f}s"
+        f"{'' if result.complete else ', time budget exhausted'})"
+    )
+    return result
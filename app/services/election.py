@@ -0,0 +1,51 @@
+import fcntl
+import logging
+import os
+from typing import IO, Optional
+
+
+class LeaderLock:
+    """
+    Exclusive advisory lock on a file next to the database, deciding which
+    of the processes sharing the database runs the background jobs. The
+    operating system releases it when the holding process exits, so another
+    process can take over by acquiring it again. Only reliable between
+    processes on one host, as is SQLite's WAL journal.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file: Optional[IO[str]] = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """
+        Tries to take the lock without blocking, returns whether it is held.
+        """
+        if self._file is not None:
+            return True
+
+        lock_file = open(self.path, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        # The holder's PID, for whoever wonders which process fetches
+        lock_file.truncate(0)
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        logging.info(f"Acquired leader lock {self.path}")
+        return True
+
+    def release(self) -> None:
+        if self._file is None:
+            return
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
@@ -0,0 +1,228 @@
+import csv
+import io
+import logging
+import time
+from datetime import datetime
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+import orjson
+from database.db import Database
+from database.layout import date_text, price_rows, price_value
+from schemas.prices import ExportFormat
+from sqlalchemy import Integer, null, select, type_coerce
+
+# Rows fetched per round-trip and encoded per chunk (a Parquet row group)
+EXPORT_BATCH_SIZE = 50000
+
+EXPORT_COLUMNS = ("id", "ticker", "currency", "date", "price")
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+
+def iter_price_batches(
+    db_instance: Database,
+    ticker: Optional[str] = None,
+    currencies: Optional[Sequence[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[List[tuple]]:
+    """
+    Streams the stored prices matching the filters in batches of rows, only
+    one batch is held in memory at a time. Dates are returned as the stored
+    "YYYY-MM-DD HH:MM:SS.ffffff" text, parsing them per row would cost more
+    than the rest of the export. Rows of the compact layout have no id.
+    """
+    prices = price_rows(db_instance)
+    compact = db_instance.compact_storage
+    stmt = select(
+        type_coerce(null(), Integer) if compact else prices.c.id,
+        prices.c.ticker,
+        prices.c.currency,
+        date_text(db_instance, prices),
+        price_value(db_instance, prices),
+    )
+    if ticker:
+        # Walks ix_bitcoin_prices_ticker_currency_date (or the compact
+        # primary key) in order
+        stmt = stmt.where(prices.c.ticker == ticker).order_by(
+            prices.c.currency, prices.c.date
+        )
+    elif compact:
+        stmt = stmt.order_by(prices.c.series_id, prices.c.date)
+    else:
+        stmt = stmt.order_by(prices.c.id)
+    if currencies:
+        stmt = stmt.where(prices.c.currency.in_(currencies))
+    if start:
+        stmt = stmt.where(prices.c.date >= start)
+    if end:
+        stmt = stmt.where(prices.c.date < end)
+
+    with db_instance.engine.connect() as connection:
+        # The selected columns need no result processing, so batches are
+        # fetched from the DBAPI cursor directly instead of being wrapped in
+        # Row objects, which takes longer than the query itself. SQLite
+        # steps the statement lazily, fetchmany keeps memory bounded.
+        cursor = connection.execute(stmt).cursor
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+
+def encode_ndjson(batches: Iterator[List[tuple]]) -> Iterator[bytes]:
+    """
+    Encodes every row as one JSON object per line.
+    """
+    for rows in batches:
+        yield b"".join(
+            orjson.dumps(
+                {
+                    "id": row_id,
+                    "ticker": ticker,
+                    "currency": currency,
+                    "date": date.replace(" ", "T"),
+                    "price": price,
+                }
+            )
+            + b"\n"
+            for row_id, ticker, currency, date, price in rows
+        )
+
+
+def encode_csv(batches: Iterator[List[tuple]]) -> Iterator[bytes]:
+    """
+    Encodes the rows as CSV with a header line.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(
+            (row_id, ticker, currency, date.replace(" ", "T"), price)
+            for row_id, ticker, currency, date, price in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # The header alone when nothing matched
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file collecting what the Parquet writer produced since the
+    last drain. It keeps counting the position, as the writer computes the
+    footer offsets from it.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def encode_parquet(batches: Iterator[List[tuple]]) -> Iterator[bytes]:
+    """
+    Encodes the rows as a Parquet file with one row group per batch.
+    """
+    # Imported lazily, pyarrow is only needed by Parquet exports
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("ticker", pa.string()),
+            ("currency", pa.string()),
+            ("date", pa.timestamp("us")),
+            ("price", pa.float64()),
+        ]
+    )
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for rows in batches:
+            row_ids, tickers, currencies, dates, prices = zip(*rows)
+            writer.write_table(
+                pa.table(
+                    [
+                        pa.array(row_ids, pa.int64()),
+                        pa.array(tickers, pa.string()),
+                        pa.array(currencies, pa.string()),
+                        pa.array(np.array(dates, dtype="datetime64[us]")),
+                        pa.array(prices, pa.float64()),
+                    ],
+                    schema=schema,
+                )
+            )
+            yield sink.drain()
+    yield sink.drain()
+
+
+ENCODERS = {
+    ExportFormat.NDJSON: encode_ndjson,
+    ExportFormat.CSV: encode_csv,
+    ExportFormat.PARQUET: encode_parquet,
+}
+
+
+def export_prices(
+    db_instance: Database,
+    export_format: ExportFormat,
+    ticker: Optional[str] = None,
+    currencies: Optional[Sequence[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    Streams the stored prices matching the filters encoded in the export
+    format, in memory bounded by the batch size regardless of table size.
+    """
+    logging.info(
+        f"Exporting prices as {export_format.value} (ticker={ticker}, "
+        f"currencies={currencies}, start={start}, end={end})"
+    )
+    rows = 0
+    started = time.perf_counter()
+
+    def count(batches: Iterator[List[tuple]]) -> Iterator[List[tuple]]:
+        nonlocal rows
+        for batch in batches:
+            rows += len(batch)
+            yield batch
+
+    batches = iter_price_batches(
+        db_instance, ticker, currencies, start, end, batch_size
+    )
+    yield from ENCODERS[export_format](count(batches))
+
+    elapsed = time.perf_counter() - started
+    logging.info(
+        f"Exported {rows} prices in {elapsed:.2f}s "
+        f"({rows / elapsed if elapsed else 0:.0f} rows/s)"
+    )
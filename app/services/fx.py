@@ -0,0 +1,191 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.price_sources import get_price_source
+from services.resilience import call_with_retries, circuit_breaker
+
+# Every conversion is derived from USD crosses, so a single set of pairs
+# serves any ticker/currency combination.
+USD = "USD"
+
+
+def get_quote_currency(ticker: str) -> str:
+    """
+    Returns the currency a ticker is quoted in (e.g. USD for BTC-USD).
+    """
+    _, _, quote = ticker.rpartition("-")
+    return quote.upper() if quote and quote != ticker else USD
+
+
+def get_usd_symbol(currency: str) -> str:
+    """
+    Returns the Yahoo Finance symbol quoting the USD value of one unit of
+    the currency (e.g. EURUSD=X).
+    """
+    return f"{currency}{USD}=X"
+
+
+def get_inverse_usd_symbol(currency: str) -> str:
+    """
+    Returns the Yahoo Finance symbol quoting the value of one USD in the
+    currency (e.g. USDJPY=X), for currencies only quoted that way.
+    """
+    return f"{USD}{currency}=X"
+
+
+class FxRateCache:
+    """
+    Caches USD crosses for a configurable time. FX rates move far slower than
+    the ticker prices, so they are refreshed independently of the fetch
+    interval and one rate is shared by all tickers. When a refresh fails,
+    the last good rate keeps being used until a download succeeds again.
+    """
+
+    def __init__(self, ttl_mins: float = 60) -> None:
+        self.ttl = timedelta(minutes=ttl_mins)
+        self.timeout_secs = 30.0
+        self.retries = 2
+        self.backoff_secs = 1.0
+        self._lock = threading.Lock()
+        # USD value of one unit of each currency and when it was fetched
+        self._rates: Dict[str, Tuple[float, datetime]] = {}
+        # Symbol each currency was last resolved through
+        self._symbols: Dict[str, str] = {}
+
+    def get_usd_rates(self, currencies: Iterable[str]) -> Dict[str, float]:
+        """
+        Returns the USD value of one unit of each currency, downloading
+        only the pairs that are missing or expired.
+        """
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            expired = sorted(
+                {
+                    currency
+                    for currency in currencies
+                    if currency != USD and not self._is_fresh(currency, now)
+                }
+            )
+            if expired:
+                self._refresh(expired, now)
+
+            rates = {USD: 1.0}
+            for currency in currencies:
+                cached = self._rates.get(currency)
+                if currency != USD and cached is not None:
+                    rates[currency] = cached[0]
+            return rates
+
+    def get_conversion_rates(
+        self,
+        quote: str,
+        currencies: List[str],
+        usd_rates: Optional[Dict[str, float]] = None,
+    ) -> Dict[str, float]:
+        """
+        Returns the multiplier converting a price quoted in `quote` into each
+        of the currencies. Currencies without a known rate are skipped.
+        `usd_rates` already fetched for the cycle avoids refreshing failed
+        pairs once per ticker.
+        """
+        if usd_rates is None:
+            usd_rates = self.get_usd_rates([quote, *currencies])
+        if quote not in usd_rates:
+            logging.error(f"No FX rate available for {quote}")
+            return {}
+
+        conversions = {}
+        for currency in currencies:
+            if currency not in usd_rates:
+                logging.error(f"No FX rate available for {quote}/{currency}")
+                continue
+            conversions[currency] = usd_rates[quote] / usd_rates[currency]
+        return conversions
+
+    def _refresh(self, currencies: List[str], now: datetime) -> None:
+        """
+        Downloads the rates of the currencies, keeping the last good rate
+        of those that could not be refreshed. Currencies without a direct
+        <CUR>USD=X quote are tried through the inverse USD<CUR>=X pair, and
+        the form that worked is used from then on.
+        """
+        symbols = {
+            currency: self._symbols.get(currency, get_usd_symbol(currency))
+            for currency in currencies
+        }
+        downloaded = self._download(sorted(set(symbols.values())))
+
+        # Only currencies never resolved before, a known pair failing is an
+        # outage rather than the wrong form
+        unresolved = {
+            currency: get_inverse_usd_symbol(currency)
+            for currency in currencies
+            if currency not in self._symbols
+            and symbols[currency] not in downloaded
+        }
+        if unresolved:
+            downloaded.update(self._download(sorted(unresolved.values())))
+            for currency, symbol in unresolved.items():
+                if symbol in downloaded:
+                    symbols[currency] = symbol
+
+        for currency, symbol in symbols.items():
+            if symbol in downloaded:
+                self._symbols[currency] = symbol
+                rate = downloaded[symbol]
+                if symbol == get_inverse_usd_symbol(currency):
+                    rate = 1 / rate
+                self._rates[currency] = (rate, now)
+                continue
+            cached = self._rates.get(currency)
+            if cached is not None:
+                logging.warning(
+                    f"Using last good {currency} rate from {cached[1]}"
+                )
+
+    def _download(self, symbols: List[str]) -> Dict[str, float]:
+        """
+        Downloads the symbols whose circuit is closed, returning the rates
+        that were available.
+        """
+        allowed = [
+            symbol for symbol in symbols if circuit_breaker.allow(symbol)
+        ]
+        if not allowed:
+            return {}
+
+        def download() -> Dict[str, float]:
+            # Sources report failed symbols as missing data, not errors
+            logging.info(f"Fetching FX rates for {allowed}")
+            rates = get_price_source().get_prices(allowed, self.timeout_secs)
+            if not rates:
+                raise ValueError("no rates returned")
+            return rates
+
+        downloaded: Dict[str, float] = {}
+        try:
+            downloaded = call_with_retries(
+                download,
+                f"FX rates {allowed}",
+                self.retries,
+                self.backoff_secs,
+            )
+        except Exception as e:
+            logging.error(f"Failed to fetch FX rates {allowed}: {e}")
+
+        for symbol in allowed:
+            if symbol in downloaded:
+                circuit_breaker.record_success(symbol)
+            else:
+                circuit_breaker.record_failure(symbol)
+        return downloaded
+
+    def _is_fresh(self, currency: str, now: datetime) -> bool:
+        cached = self._rates.get(currency)
+        return cached is not None and now - cached[1] < self.ttl
+
+
+# Process-wide cache shared by all tickers
+fx_rates = FxRateCache()
@@ -0,0 +1,297 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import pandas as pd
+import yfinance as yf
+from database.db import Database
+from database.layout import get_series_ids, price_rows
+from database.models import BitcoinPrice, CompactPrice
+from database.types import PRICE_SCALE
+from services.backfill import INTERVAL_LIMITS
+from services.fx import (
+    USD,
+    get_inverse_usd_symbol,
+    get_quote_currency,
+    get_usd_symbol,
+)
+from services.rollups import bar_weight, upsert_daily_rollups
+from sqlalchemy import Integer, String, insert, select, type_coerce
+from sqlalchemy.orm import Session
+
+# Rows inserted per transaction
+BACKFILL_BATCH_SIZE = 50000
+
+# How SQLAlchemy stores DateTime columns in SQLite
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def fetch_history(
+    symbol: str, start: datetime, end: datetime, interval: str
+) -> pd.Series:
+    """
+    Retrieves the closes of a symbol between start and end, split into as
+    many requests as the interval requires. Returns them indexed by UTC bar
+    start.
+    """
+    _, request_span, _ = INTERVAL_LIMITS[interval]
+    closes = []
+    window_start = start
+    while window_start < end:
+        window_end = (
+            min(end, window_start + request_span) if request_span else end
+        )
+        logging.info(
+            f"Fetching {interval} {symbol} history from "
+            f"{window_start.isoformat()} to {window_end.isoformat()}"
+        )
+        history = yf.Ticker(symbol).history(
+            start=window_start, end=window_end, interval=interval
+        )
+        if not history.empty:
+            closes.append(history["Close"])
+        window_start = window_end
+
+    if not closes:
+        return pd.Series(dtype=float, index=pd.DatetimeIndex([], tz="UTC"))
+
+    series = pd.concat(closes)
+    if series.index.tz is None:
+        series.index = series.index.tz_localize("UTC")
+    else:
+        series.index = series.index.tz_convert("UTC")
+    # Adjacent windows can both return the bar on their boundary
+    series = series[~series.index.duplicated(keep="last")]
+    return series.sort_index().dropna()
+
+
+def fetch_usd_history(
+    currency: str, start: datetime, end: datetime, interval: str
+) -> pd.Series:
+    """
+    Retrieves the USD value of one unit of the currency between start and
+    end, through the inverse USD<CUR>=X pair when it has no direct quote.
+    """
+    rates = fetch_history(get_usd_symbol(currency), start, end, interval)
+    if rates.empty:
+        rates = 1 / fetch_history(
+            get_inverse_usd_symbol(currency), start, end, interval
+        )
+    return rates
+
+
+def drop_stored(
+    db_instance: Database, rows: pd.DataFrame, ticker: str, bar: timedelta
+) -> pd.DataFrame:
+    """
+    Drops the bars whose interval already holds a stored price of the same
+    ticker and currency, so re-runs are idempotent and periods covered by
+    fetched prices are not counted twice.
+    """
+    prices = price_rows(db_instance)
+    compact = db_instance.compact_storage
+    with db_instance.session() as db:
+        stored = db.execute(
+            select(
+                prices.c.currency,
+                type_coerce(prices.c.date, Integer if compact else String),
+            )
+            .where(prices.c.ticker == ticker)
+            .where(prices.c.date >= rows["date"].min())
+        ).all()
+    if not stored:
+        return rows
+
+    stored = pd.DataFrame(stored, columns=["currency", "date"])
+    if compact:
+        stored_dates = pd.to_datetime(stored["date"], unit="ms")
+    else:
+        stored_dates = pd.to_datetime(stored["date"], format="ISO8601")
+    stored_keys = pd.MultiIndex.from_arrays(
+        [stored["currency"], stored_dates.dt.floor(bar)]
+    )
+    bar_keys = pd.MultiIndex.from_arrays(
+        [rows["currency"], rows["date"].dt.floor(bar)]
+    )
+    return rows[~bar_keys.isin(stored_keys)]
+
+
+def compact_values(
+    db: Session, db_instance: Database, rows: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Returns the rows as series_id, ts and price columns of compact_prices.
+    """
+    series_ids = get_series_ids(
+        db, db_instance, set(zip(rows["ticker"], rows["currency"]))
+    )
+    return pd.DataFrame(
+        {
+            "series_id": [
+                series_ids[pair]
+                for pair in zip(rows["ticker"], rows["currency"])
+            ],
+            "ts": rows["date"]
+            .to_numpy()
+            .astype("datetime64[ms]")
+            .astype("int64"),
+            "price": (rows["price"] * PRICE_SCALE).round().astype("int64"),
+        }
+    )
+
+
+def insert_rows(
+    db_instance: Database, rows: pd.DataFrame, weight: float
+) -> int:
+    """
+    Bulk-inserts the rows, each standing for `weight` fetched prices, and
+    folds them into the daily rollups, committing every BACKFILL_BATCH_SIZE
+    rows.
+    """
+    rows = rows.sort_values(["ticker", "currency", "date"])
+    for offset in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        batch = rows.iloc[offset : offset + BACKFILL_BATCH_SIZE]
+        with db_instance.session() as db:
+            # Dates (and compact prices) are converted in one vectorized
+            # pass and the rows go straight to executemany, per-row bind
+            # processing would take longer than SQLite needs to write them.
+            if db_instance.compact_storage:
+                values = compact_values(db, db_instance, batch).assign(
+                    weight=weight
+                )
+                stmt = (
+                    insert(CompactPrice.__table__)
+                    .prefix_with("OR IGNORE")
+                    .compile(
+                        dialect=db.bind.dialect,
+                        column_keys=list(values.columns),
+                    )
+                )
+            else:
+                values = batch.assign(
+                    date=batch["date"].dt.strftime(SQLITE_DATETIME_FORMAT),
+                    weight=weight,
+                )
+                stmt = insert(BitcoinPrice.__table__).compile(
+                    dialect=db.bind.dialect, column_keys=list(values.columns)
+                )
+            values = values[list(stmt.positiontup)]
+            db.connection().exec_driver_sql(
+                str(stmt), list(values.itertuples(index=False, name=None))
+            )
+
+            # One partial bucket per day instead of one upsert per row
+            buckets = (
+                batch.groupby(
+                    [
+                        "ticker",
+                        "currency",
+                        batch["date"].dt.date.rename("day"),
+                    ],
+                    sort=False,
+                )
+                .agg(
+                    price_sum=("price", "sum"),
+                    price_count=("price", "size"),
+                    price_min=("price", "min"),
+                    price_max=("price", "max"),
+                    price_first=("price", "first"),
+                    price_last=("price", "last"),
+                    first_date=("date", "first"),
+                    last_date=("date", "last"),
+                )
+                .reset_index()
+                .assign(
+                    price_sum=lambda bucket: bucket["price_sum"] * weight,
+                    price_weight=lambda bucket: bucket["price_count"] * weight,
+                )
+            )
+            upsert_daily_rollups(db, buckets.to_dict("records"))
+            db.commit()
+    return len(rows)
+
+
+def load_history(
+    db_instance: Database,
+    tickers: List[str],
+    currencies: List[str],
+    days: float,
+    interval: str,
+    fetch_interval: timedelta,
+) -> int:
+    """
+    Loads the last `days` of ticker history converted into every currency
+    at the interval. The bars are weighted in the rollups by the prices
+    fetched every `fetch_interval` they stand for. Returns the number of
+    prices stored.
+    """
+    bar, _, _ = INTERVAL_LIMITS[interval]
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    logging.info(
+        f"Backfilling {days} days of {interval} history for tickers "
+        f"{tickers} / currencies {currencies}"
+    )
+    started = time.perf_counter()
+
+    # USD crosses of every quote and target currency, one series each
+    fx_currencies = sorted(
+        ({get_quote_currency(ticker) for ticker in tickers} | set(currencies))
+        - {USD}
+    )
+    usd_rates = pd.DataFrame(
+        {
+            currency: fetch_usd_history(currency, start, end, interval)
+            for currency in fx_currencies
+        },
+        columns=fx_currencies,
+    )
+
+    stored = 0
+    for ticker in tickers:
+        prices = fetch_history(ticker, start, end, interval)
+        if prices.empty:
+            logging.error(f"No {interval} history available for {ticker}")
+            continue
+
+        # FX pairs do not trade on weekends, so the last known rate is
+        # carried over the ticker bars (and the first one back to the
+        # start of the range).
+        rates = (
+            usd_rates.reindex(usd_rates.index.union(prices.index))
+            .ffill()
+            .bfill()
+            .reindex(prices.index)
+        )
+        rates[USD] = 1.0
+        quote_rates = rates[get_quote_currency(ticker)]
+
+        frames = []
+        for currency in currencies:
+            converted = (prices * quote_rates / rates[currency]).dropna()
+            if converted.empty:
+                logging.error(f"No FX history available for {currency}")
+                continue
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "ticker": ticker,
+                        "currency": currency,
+                        "price": converted.to_numpy(),
+                        # Stored as naive UTC like the fetched prices
+                        "date": converted.index.tz_localize(None),
+                    }
+                )
+            )
+        if not frames:
+            continue
+
+        rows = drop_stored(db_instance, pd.concat(frames), ticker, bar)
+        stored += insert_rows(
+            db_instance, rows, bar_weight(bar, fetch_interval)
+        )
+
+    elapsed = time.perf_counter() - started
+    logging.info(f"Backfilled {stored} prices in {elapsed:.2f}s")
+    return stored
@@ -0,0 +1,51 @@
+import logging
+
+from database.db import Database
+
+
+def maintain_db(db_instance: Database) -> None:
+    """
+    Checkpoints the write-ahead log back into the database file and lets
+    SQLite refresh the planner statistics of tables that changed.
+    """
+    logging.info(
+        f"Running maintenance on {db_instance.db_dir}/{db_instance.db_name}"
+    )
+    with db_instance.engine.connect() as connection:
+        busy, log_pages, checkpointed = connection.exec_driver_sql(
+            "PRAGMA wal_checkpoint(TRUNCATE)"
+        ).one()
+        connection.exec_driver_sql("PRAGMA optimize")
+        connection.commit()
+
+    logging.info(
+        f"WAL checkpoint: busy={busy} log_pages={log_pages} "
+        f"checkpointed={checkpointed}"
+    )
+
+
+def incremental_vacuum(db_instance: Database, pages: int) -> None:
+    """
+    Returns up to `pages` free pages to the file system. Only has an effect
+    on databases using auto_vacuum=INCREMENTAL.
+    """
+    connection = db_instance.engine.raw_connection()
+    try:
+        # The pragma frees one page per step, executescript runs it to the end
+        connection.driver_connection.executescript(
+            f"PRAGMA incremental_vacuum({pages})"
+        )
+    finally:
+        connection.close()
+
+
+def vacuum_db(db_instance: Database) -> None:
+    """
+    Rebuilds the database file, which also applies a changed auto_vacuum
+    mode to an existing database.
+    """
+    logging.info(f"Vacuuming {db_instance.db_dir}/{db_instance.db_name}")
+    with db_instance.engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as connection:
+        connection.exec_driver_sql("VACUUM")
@@ -0,0 +1,348 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List
+
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+    JobEvent,
+)
+from apscheduler.schedulers.base import BaseScheduler
+from database.db import Database
+from database.models import DailyPriceRollup
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from services.price_cache import latest_prices
+from services.price_stream import price_hub
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Set by the main process when it starts several workers
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# Requests are mostly served from memory, statements and fetches take longer
+REQUEST_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+QUERY_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    1.0,
+    5.0,
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response headers of an HTTP request are sent",
+    ["method", "route", "status"],
+    buckets=REQUEST_BUCKETS,
+)
+QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "Time spent executing database statements",
+    ["engine", "statement"],
+    buckets=QUERY_BUCKETS,
+)
+FETCH_LATENCY = Histogram(
+    "price_fetch_duration_seconds",
+    "Time spent fetching and converting the price of a ticker",
+    ["ticker"],
+)
+FETCH_FAILURES = Counter(
+    "price_fetch_failures",
+    "Prices that could not be fetched",
+    ["ticker", "currency"],
+)
+LAST_FETCH = Gauge(
+    "price_last_fetch_timestamp_seconds",
+    "Time prices were last fetched and stored",
+    multiprocess_mode="max",
+)
+JOB_DURATION = Histogram(
+    "scheduler_job_duration_seconds",
+    "Time spent running background jobs",
+    ["job"],
+)
+JOB_FAILURES = Counter(
+    "scheduler_job_failures", "Background job runs that raised", ["job"]
+)
+JOB_MISSED = Counter(
+    "scheduler_job_missed",
+    "Background job runs skipped for starting too late or overlapping a "
+    "running one",
+    ["job"],
+)
+CLEANUP_DELETED = Counter(
+    "cleanup_rows_deleted", "Expired prices deleted by the clean up job"
+)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every HTTP request by route template, so path
+    and query parameters do not multiply the series. Streaming responses
+    are timed until their headers are sent.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        recorded = False
+
+        def record(status_code: int) -> None:
+            nonlocal recorded
+            recorded = True
+            # Set on the scope by the router once a route matched
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_code),
+            ).observe(time.perf_counter() - started)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not recorded:
+                record(500)
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """
+    Times every statement executed by the engine, labelled by its leading
+    keyword (SELECT, INSERT, ...).
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        started = conn.info["query_started"].pop()
+        keyword = statement.lstrip().split(None, 1)[0].upper()
+        QUERY_LATENCY.labels(name, keyword).observe(
+            time.perf_counter() - started
+        )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # The statement failed, after_cursor_execute will not pop its start
+        if context.connection is not None:
+            started = context.connection.info.get("query_started")
+            if started:
+                started.pop()
+
+
+def instrument_database(db_instance: Database) -> None:
+    """
+    Times the statements of both the synchronous and asynchronous engines.
+    """
+    instrument_engine(db_instance.engine, "sync")
+    instrument_engine(db_instance.async_engine.sync_engine, "async")
+
+
+def instrument_scheduler(scheduler: BaseScheduler) -> None:
+    """
+    Records the duration, failures and missed runs of the scheduler jobs.
+    Runs are timed from their submission to the executor.
+    """
+    submitted: Dict[str, float] = {}
+
+    def on_submitted(job_event: JobEvent) -> None:
+        submitted[job_event.job_id] = time.perf_counter()
+
+    def on_finished(job_event: JobEvent) -> None:
+        started = submitted.pop(job_event.job_id, None)
+        if started is not None:
+            JOB_DURATION.labels(job_event.job_id).observe(
+                time.perf_counter() - started
+            )
+        if job_event.code == EVENT_JOB_ERROR:
+            JOB_FAILURES.labels(job_event.job_id).inc()
+
+    def on_missed(job_event: JobEvent) -> None:
+        logging.warning(f"Skipped a run of job {job_event.job_id}")
+        JOB_MISSED.labels(job_event.job_id).inc()
+
+    scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+    scheduler.add_listener(on_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+    scheduler.add_listener(
+        on_missed, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES
+    )
+
+
+# Process start, stands in for the data age until prices are known
+STARTED_AT = datetime.now(timezone.utc)
+
+
+def get_data_age() -> timedelta:
+    """
+    Returns the age of the newest cached price, or the uptime while no
+    prices are known.
+    """
+    newest = latest_prices.newest_date()
+    if newest is None:
+        return datetime.now(timezone.utc) - STARTED_AT
+    # Prices are stored as naive UTC
+    return datetime.now(timezone.utc) - newest.replace(tzinfo=timezone.utc)
+
+
+class DatabaseCollector(Collector):
+    """
+    Reports the values read on scrape: stored price counts, the database
+    file size, the connection pool usage, the data age and connected stream
+    clients.
+    """
+
+    def __init__(self, db_instance: Database) -> None:
+        self.db_instance = db_instance
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        rows = GaugeMetricFamily(
+            "price_rows",
+            "Stored prices per ticker and currency",
+            labels=["ticker", "currency"],
+        )
+        try:
+            # Summing the rollup counts reads one row per day instead of
+            # counting every stored price
+            with self.db_instance.session() as db:
+                counts = db.execute(
+                    select(
+                        DailyPriceRollup.ticker,
+                        DailyPriceRollup.currency,
+                        func.sum(DailyPriceRollup.price_count),
+                    ).group_by(
+                        DailyPriceRollup.ticker, DailyPriceRollup.currency
+                    )
+                ).all()
+            for ticker, currency, count in counts:
+                rows.add_metric([ticker, currency], count)
+        except Exception as e:
+            logging.error(f"Failed to count stored prices: {e}")
+        yield rows
+
+        db_path = os.path.join(
+            self.db_instance.db_dir, self.db_instance.db_name
+        )
+        # The write-ahead log holds pages not checkpointed yet
+        size = sum(
+            os.path.getsize(path)
+            for path in (db_path, f"{db_path}-wal")
+            if os.path.exists(path)
+        )
+        yield GaugeMetricFamily(
+            "db_file_size_bytes", "Size of the database files", value=size
+        )
+
+        pools = {
+            key: GaugeMetricFamily(name, documentation, labels=["engine"])
+            for key, name, documentation in (
+                ("size", "db_pool_size", "Connections kept in the pool"),
+                (
+                    "checked_out",
+                    "db_pool_checked_out",
+                    "Connections currently in use",
+                ),
+                (
+                    "overflow",
+                    "db_pool_overflow",
+                    "Connections opened beyond the pool size, negative "
+                    "while the pool is not full",
+                ),
+            )
+        }
+        for engine, status in self.db_instance.pool_status().items():
+            for key, gauge in pools.items():
+                gauge.add_metric([engine], status[key])
+        yield from pools.values()
+
+        yield GaugeMetricFamily(
+            "price_data_age_seconds",
+            "Age of the newest price, the uptime while none is known",
+            value=get_data_age().total_seconds(),
+        )
+        yield GaugeMetricFamily(
+            "price_stream_clients",
+            "Connected price stream clients",
+            value=price_hub.subscriber_count,
+        )
+
+
+# Collectors reporting values read on scrape, see metrics_registry()
+scrape_collectors: List[Collector] = []
+
+
+def register_database_collector(db_instance: Database) -> None:
+    """
+    Registers the scrape-time metrics of the database.
+    """
+    collector = DatabaseCollector(db_instance)
+    scrape_collectors.append(collector)
+    if MULTIPROC_DIR_ENV not in os.environ:
+        REGISTRY.register(collector)
+
+
+def metrics_registry() -> CollectorRegistry:
+    """
+    Returns the registry to expose. With several worker processes every one
+    of them writes its metrics to the directory named by
+    PROMETHEUS_MULTIPROC_DIR, which are aggregated on each scrape.
+    """
+    if MULTIPROC_DIR_ENV not in os.environ:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    for collector in scrape_collectors:
+        registry.register(collector)
+    return registry
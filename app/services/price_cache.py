@@ -0,0 +1,117 @@
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from database.db import Database
+from database.layout import price_rows
+from sqlalchemy import select
+
+
+class CachedPrice(NamedTuple):
+    price: float
+    date: datetime
+
+
+class LatestPriceCache:
+    """
+    In-memory store of the most recent price per ticker and currency.
+
+    Writers replace the whole mapping under a lock while readers only ever
+    dereference the current mapping, so lookups never block on the
+    background job that publishes new prices.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._prices: Dict[Tuple[str, str], CachedPrice] = {}
+        self.updated_at: Optional[datetime] = None
+
+    def publish(
+        self, ticker: str, currency: str, price: float, date: datetime
+    ) -> bool:
+        """
+        Records a price unless the same or a newer one for the
+        ticker/currency is known. Returns whether the price was recorded.
+        """
+        with self._lock:
+            current = self._prices.get((ticker, currency))
+            if current is not None and current.date >= date:
+                return False
+            prices = dict(self._prices)
+            prices[(ticker, currency)] = CachedPrice(price, date)
+            self.updated_at = datetime.now(timezone.utc)
+            self._prices = prices
+            return True
+
+    def get(
+        self, ticker: str, currencies: List[str]
+    ) -> Optional[Dict[str, CachedPrice]]:
+        """
+        Returns the cached prices, or None when any currency is missing.
+        """
+        prices = self._prices
+        try:
+            return {
+                currency: prices[(ticker, currency)] for currency in currencies
+            }
+        except KeyError:
+            return None
+
+    def version(self, ticker: str) -> Tuple[Tuple[str, float, str], ...]:
+        """
+        Returns the (currency, price, date) of the cached prices of the
+        ticker, empty when none is cached. Derived from the stored data, so
+        every process and restart identifies the same prices the same way.
+        """
+        prices = self._prices
+        return tuple(
+            sorted(
+                (currency, record.price, record.date.isoformat())
+                for (cached_ticker, currency), record in prices.items()
+                if cached_ticker == ticker
+            )
+        )
+
+    def newest_date(self) -> Optional[datetime]:
+        """
+        Returns the date of the most recent cached price, None when empty.
+        """
+        prices = self._prices
+        if not prices:
+            return None
+        return max(record.date for record in prices.values())
+
+    def warm_up(
+        self, db_instance: Database, tickers: List[str], currencies: List[str]
+    ) -> Dict[str, Dict[str, CachedPrice]]:
+        """
+        Loads the latest stored price of every ticker/currency from the
+        database. Returns the prices newer than the cached ones per ticker.
+        """
+        logging.debug(
+            f"Warming up latest price cache for {tickers} / {currencies}"
+        )
+        updated: Dict[str, Dict[str, CachedPrice]] = {}
+        stored = price_rows(db_instance)
+        with db_instance.session() as db:
+            for ticker in tickers:
+                for currency in currencies:
+                    record = db.execute(
+                        select(stored.c.price, stored.c.date)
+                        .where(stored.c.ticker == ticker)
+                        .where(stored.c.currency == currency)
+                        .order_by(stored.c.date.desc())
+                        .limit(1)
+                    ).first()
+                    if record and self.publish(
+                        ticker, currency, record.price, record.date
+                    ):
+                        updated.setdefault(ticker, {})[currency] = CachedPrice(
+                            record.price, record.date
+                        )
+        return updated
+
+
+# Process-wide cache shared by the scheduler jobs and the API routers
+latest_prices = LatestPriceCache()
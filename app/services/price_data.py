@@ -1,52 +1,204 @@
 import logging
-from typing import List
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Dict, List
 
-import yfinance as yf
 from database.db import Database
-from database.models import BitcoinPrice
-
-
-def get_current_price(ticker: str, currency: str) -> float:
-    """
-    Retrieves the current price of ticker in the specified currency.
-    """
-    logging.info(f"Fetching ticker {ticker} data for {currency} currency")
-    btc = yf.Ticker(ticker)
-    price_usd = btc.history(period="1d")["Close"].iloc[-1]
-
-    if currency == "EUR":
-        # EUR conversion
-        eur_usd = yf.Ticker("EURUSD=X")
-        rate = eur_usd.history(period="1d")["Close"].iloc[-1]
-        return price_usd * rate
-    elif currency == "CZK":
-        # CZK conversion
-        czk_usd = yf.Ticker("CZKUSD=X")
-        rate = czk_usd.history(period="1d")["Close"].iloc[-1]
-        return price_usd * rate
-    else:
-        raise ValueError(
-            f"Unsupported ticket/currency pair {ticker}/{currency}"
-        )
+from database.layout import insert_prices
+from services.analytics import rolling_stats
+from services.fx import fx_rates, get_quote_currency
+from services.metrics import FETCH_FAILURES, FETCH_LATENCY, LAST_FETCH
+from services.price_cache import CachedPrice, latest_prices
+from services.price_sources import get_price_source
+from services.price_stream import price_hub
+from services.resilience import (
+    CircuitOpenError,
+    call_with_retries,
+    circuit_breaker,
+    retry_budget,
+)
+from services.rollups import update_daily_rollups
+
+
+def get_current_prices(
+    ticker: str,
+    currencies: List[str],
+    usd_rates: Dict[str, float],
+    timeout_secs: float,
+    retries: int,
+    backoff_secs: float,
+) -> Dict[str, float]:
+    """
+    Retrieves the current price of ticker in each of the specified currencies.
+    The ticker is fetched once, retried on failure, and converted with the
+    FX rates of the fetch cycle.
+    """
+    logging.info(f"Fetching ticker {ticker} data for {currencies} currencies")
+
+    def fetch() -> float:
+        with FETCH_LATENCY.labels(ticker).time():
+            return get_price_source().get_price(ticker, timeout_secs)
+
+    # A failed fetch with all its retries counts once towards the circuit
+    price = circuit_breaker.call(
+        ticker,
+        lambda: call_with_retries(fetch, ticker, retries, backoff_secs),
+    )
+    rates = fx_rates.get_conversion_rates(
+        get_quote_currency(ticker), currencies, usd_rates
+    )
+    for currency in currencies:
+        if currency not in rates:
+            FETCH_FAILURES.labels(ticker, currency).inc()
+    return {currency: price * rate for currency, rate in rates.items()}
+
+
+def fetch_all_prices(
+    tickers: List[str],
+    currencies: List[str],
+    fetch_workers: int,
+    fetch_timeout_secs: float,
+    fetch_retries: int,
+    fetch_retry_backoff_secs: float,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Retrieves the current prices of all tickers concurrently on a bounded
+    thread pool. Tickers that fail, time out or whose circuit is open are
+    left out of the result.
+    """
+    # Fetch the shared FX rates once up front so the workers only fetch
+    # tickers, failed pairs fall back to their last good rate.
+    quotes = {get_quote_currency(ticker) for ticker in tickers}
+    usd_rates = fx_rates.get_usd_rates(quotes | set(currencies))
+
+    workers = max(1, min(fetch_workers, len(tickers)))
+    executor = ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="fetch"
+    )
+    futures = {
+        executor.submit(
+            get_current_prices,
+            ticker,
+            currencies,
+            usd_rates,
+            fetch_timeout_secs,
+            fetch_retries,
+            fetch_retry_backoff_secs,
+        ): ticker
+        for ticker in tickers
+    }
+    # Tickers beyond the pool size queue up, each wave gets the full budget
+    timeout = retry_budget(
+        fetch_timeout_secs, fetch_retries, fetch_retry_backoff_secs
+    ) * math.ceil(len(tickers) / workers)
+    done, not_done = wait(futures, timeout=timeout)
+    # Do not wait for hanging fetches, their results are discarded
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    prices = {}
+    failed = []
+    for future in not_done:
+        logging.error(f"Timed out fetching {futures[future]} after {timeout}s")
+        failed.append(futures[future])
+    for future in done:
+        ticker = futures[future]
+        try:
+            prices[ticker] = future.result()
+        except CircuitOpenError as e:
+            logging.warning(f"Skipped fetching {ticker}: {e}")
+            failed.append(ticker)
+        except Exception as e:
+            logging.error(f"Failed to fetch {ticker}: {e}")
+            failed.append(ticker)
+    for ticker in failed:
+        for currency in currencies:
+            FETCH_FAILURES.labels(ticker, currency).inc()
+    return prices
 
 
 def store_prices(
-    db_dir: str, db_name: str, ticker: str, currencies: List[str]
+    db_instance: Database,
+    tickers: List[str],
+    currencies: List[str],
+    fetch_workers: int,
+    fetch_timeout_secs: float,
+    fetch_retries: int,
+    fetch_retry_backoff_secs: float,
 ) -> None:
     """
-    Stores the current Bitcoin prices in EUR and CZK to the database.
+    Stores the current ticker prices in the configured currencies to the database.
+    All prices of a fetch cycle are written with one bulk insert in a single
+    transaction.
     """
     logging.info(
-        f"Storing database data for ticker {ticker} / currencies {currencies}"
+        f"Storing database data for tickers {tickers} / currencies {currencies}"
     )
-    db_instance = Database(db_dir, db_name)
-    db = next(db_instance.get_db())
-    for currency in currencies:
-        try:
-            price = get_current_price(ticker, currency=currency)
-            logging.info(f"Current {ticker} price in {currency}: {price}")
-            new_price = BitcoinPrice(price=price, currency=currency)
-            db.add(new_price)
-            db.commit()
-        except ValueError as e:
-            logging.error(f"Failed to store data: {e}")
+    prices = fetch_all_prices(
+        tickers,
+        currencies,
+        fetch_workers,
+        fetch_timeout_secs,
+        fetch_retries,
+        fetch_retry_backoff_secs,
+    )
+
+    # Stored as naive UTC, matching the column's server default
+    date = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = [
+        {"ticker": ticker, "currency": currency, "price": price, "date": date}
+        for ticker, ticker_prices in prices.items()
+        for currency, price in ticker_prices.items()
+    ]
+    if not rows:
+        logging.error(f"Failed to store data: no prices for {tickers}")
+        return
+
+    for row in rows:
+        logging.info(
+            f"Current {row['ticker']} price in {row['currency']}: {row['price']}"
+        )
+
+    started = time.perf_counter()
+    with db_instance.session() as db:
+        insert_prices(db, db_instance, rows)
+        update_daily_rollups(db, rows)
+        db.commit()
+    elapsed = time.perf_counter() - started
+    LAST_FETCH.set_to_current_time()
+    logging.info(
+        f"Stored {len(rows)} prices in {elapsed:.3f}s "
+        f"({len(rows) / elapsed:.0f} rows/s)"
+    )
+
+    for row in rows:
+        latest_prices.publish(
+            row["ticker"], row["currency"], row["price"], row["date"]
+        )
+        rolling_stats.add(
+            row["ticker"], row["currency"], row["price"], row["date"]
+        )
+
+    # Push the new prices to the stream clients, one message per ticker
+    for ticker, ticker_prices in prices.items():
+        price_hub.publish(
+            ticker,
+            {
+                currency: CachedPrice(price, date)
+                for currency, price in ticker_prices.items()
+            },
+        )
+
+
+def refresh_latest_prices(
+    db_instance: Database, tickers: List[str], currencies: List[str]
+) -> None:
+    """
+    Picks up the prices stored by the process running the fetch job: newer
+    ones are cached and pushed to this process's stream clients.
+    """
+    updated = latest_prices.warm_up(db_instance, tickers, currencies)
+    rolling_stats.load(db_instance, tickers, currencies)
+    for ticker, ticker_prices in updated.items():
+        price_hub.publish(ticker, ticker_prices)
@@ -0,0 +1,303 @@
+import bisect
+import csv
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+PRICE_SOURCES = ["yfinance", "http", "replay"]
+
+# Yahoo Finance rejects requests without a browser-like user agent
+YAHOO_CHART_URL = "https://query2.finance.yahoo.com/v8/finance/chart/{symbol}"
+YAHOO_HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64)"}
+
+
+class PriceSource(ABC):
+    """
+    Where the latest quotes of tickers (e.g. BTC-USD) and FX pairs (e.g.
+    EURUSD=X) come from. Implementations are called from the fetch worker
+    threads concurrently.
+    """
+
+    @abstractmethod
+    def get_price(self, symbol: str, timeout_secs: float) -> float:
+        """
+        Returns the latest price of the symbol, raising when there is none.
+        """
+
+    def get_prices(
+        self, symbols: List[str], timeout_secs: float
+    ) -> Dict[str, float]:
+        """
+        Returns the latest price of every symbol. Symbols without data are
+        left out of the result.
+        """
+        prices = {}
+        for symbol in symbols:
+            try:
+                prices[symbol] = self.get_price(symbol, timeout_secs)
+            except Exception as e:
+                logging.error(f"Failed to fetch {symbol}: {e}")
+        return prices
+
+    def close(self) -> None:
+        pass
+
+
+class YFinanceSource(PriceSource):
+    """
+    Quotes from yfinance: a DataFrame of the day's bars per request, FX
+    pairs are downloaded in one batch.
+    """
+
+    def get_price(self, symbol: str, timeout_secs: float) -> float:
+        import yfinance as yf
+
+        closes = yf.Ticker(symbol).history(period="1d", timeout=timeout_secs)
+        if closes.empty:
+            raise ValueError(f"No price data returned for {symbol}")
+        return float(closes["Close"].iloc[-1])
+
+    def get_prices(
+        self, symbols: List[str], timeout_secs: float
+    ) -> Dict[str, float]:
+        import pandas as pd
+        import yfinance as yf
+
+        closes = yf.download(
+            symbols, period="1d", progress=False, timeout=timeout_secs
+        )["Close"]
+        if isinstance(closes, pd.Series):
+            # A single symbol is returned without the per-ticker column level
+            closes = closes.to_frame(name=symbols[0])
+        if closes.empty:
+            return {}
+
+        # Use the last known close of each symbol, the batched frame is
+        # aligned on a shared index so symbols can have gaps at the most
+        # recent row.
+        last = closes.ffill().iloc[-1]
+        prices = {}
+        for symbol in symbols:
+            price = float(last.get(symbol, math.nan))
+            if math.isfinite(price) and price > 0:
+                prices[symbol] = price
+        return prices
+
+
+class HttpSource(PriceSource):
+    """
+    Quotes read directly from the Yahoo Finance chart API over a shared,
+    pooled HTTP client, without building a DataFrame per request. The chart
+    API quotes one symbol per request, so batches are requested
+    concurrently.
+    """
+
+    def __init__(self, max_connections: int = 8) -> None:
+        import httpx
+
+        self.max_connections = max_connections
+        self.client = httpx.Client(
+            headers=YAHOO_HEADERS,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    def get_price(self, symbol: str, timeout_secs: float) -> float:
+        response = self.client.get(
+            YAHOO_CHART_URL.format(symbol=symbol),
+            params={"range": "1d", "interval": "1d"},
+            timeout=timeout_secs,
+        )
+        response.raise_for_status()
+        results = response.json()["chart"]["result"]
+        price = (
+            results[0]["meta"].get("regularMarketPrice") if results else None
+        )
+        if price is None or not price > 0:
+            raise ValueError(f"No price data returned for {symbol}")
+        return float(price)
+
+    def get_prices(
+        self, symbols: List[str], timeout_secs: float
+    ) -> Dict[str, float]:
+        """
+        Requests the symbols concurrently on the pooled client, so a batch
+        of FX pairs takes one round trip rather than one per pair.
+        """
+        if not symbols:
+            return {}
+
+        prices = {}
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_connections, len(symbols)),
+            thread_name_prefix="quote",
+        ) as executor:
+            futures = {
+                executor.submit(self.get_price, symbol, timeout_secs): symbol
+                for symbol in symbols
+            }
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    prices[symbol] = future.result()
+                except Exception as e:
+                    logging.error(f"Failed to fetch {symbol}: {e}")
+        return prices
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class ReplaySource(PriceSource):
+    """
+    Replays quotes recorded in a CSV file with date, symbol and price
+    columns, e.g. by --record-quotes-file. The recording starts playing
+    when the source is created, `speed` times faster than it was recorded,
+    and starts over once it reaches the end. Before the first quote of a
+    symbol, that quote is returned.
+    """
+
+    def __init__(self, path: str, speed: float = 1) -> None:
+        if speed <= 0:
+            raise ValueError(f"Replay speed must be positive, got {speed}")
+        self.speed = speed
+        self._quotes: Dict[str, Tuple[List[float], List[float]]] = {}
+
+        with open(path, newline="") as file:
+            for row in csv.DictReader(file):
+                timestamp = parse_date(row["date"]).timestamp()
+                times, prices = self._quotes.setdefault(
+                    row["symbol"], ([], [])
+                )
+                times.append(timestamp)
+                prices.append(float(row["price"]))
+        if not self._quotes:
+            raise ValueError(f"No quotes recorded in {path}")
+
+        for times, prices in self._quotes.values():
+            order = sorted(range(len(times)), key=times.__getitem__)
+            times[:] = [times[i] for i in order]
+            prices[:] = [prices[i] for i in order]
+        self._start = min(times[0] for times, _ in self._quotes.values())
+        end = max(times[-1] for times, _ in self._quotes.values())
+        self._duration = end - self._start
+        self._started_at = time.monotonic()
+        logging.info(
+            f"Replaying {len(self._quotes)} symbols from {path} "
+            f"({self._duration:.0f}s recorded) at {speed}x"
+        )
+
+    def replay_time(self) -> float:
+        """
+        Returns the recorded timestamp the replay is at.
+        """
+        elapsed = (time.monotonic() - self._started_at) * self.speed
+        if self._duration:
+            elapsed %= self._duration
+        return self._start + elapsed
+
+    def get_price(self, symbol: str, timeout_secs: float) -> float:
+        if symbol not in self._quotes:
+            raise ValueError(f"No quotes recorded for {symbol}")
+        times, prices = self._quotes[symbol]
+        index = bisect.bisect_right(times, self.replay_time())
+        return prices[max(index - 1, 0)]
+
+
+class RecordingSource(PriceSource):
+    """
+    Appends every quote fetched through another source to a CSV file that
+    ReplaySource can play back.
+    """
+
+    def __init__(self, source: PriceSource, path: str) -> None:
+        self.source = source
+        self.path = path
+        self._lock = threading.Lock()
+
+    def get_price(self, symbol: str, timeout_secs: float) -> float:
+        price = self.source.get_price(symbol, timeout_secs)
+        self._record({symbol: price})
+        return price
+
+    def get_prices(
+        self, symbols: List[str], timeout_secs: float
+    ) -> Dict[str, float]:
+        prices = self.source.get_prices(symbols, timeout_secs)
+        self._record(prices)
+        return prices
+
+    def close(self) -> None:
+        self.source.close()
+
+    def _record(self, prices: Dict[str, float]) -> None:
+        date = datetime.now(timezone.utc).isoformat()
+        with self._lock, open(self.path, "a", newline="") as file:
+            writer = csv.writer(file)
+            if file.tell() == 0:
+                writer.writerow(["date", "symbol", "price"])
+            for symbol, price in prices.items():
+                writer.writerow([date, symbol, price])
+
+
+def parse_date(value: str) -> datetime:
+    """
+    Parses an ISO date, naive dates are taken as UTC.
+    """
+    date = datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date
+
+
+def create_price_source(
+    name: str,
+    replay_file: Optional[str] = None,
+    replay_speed: float = 1,
+    record_file: Optional[str] = None,
+    max_connections: int = 8,
+) -> PriceSource:
+    """
+    Creates the price source selected by name, recording its quotes to
+    `record_file` when given.
+    """
+    if name == "yfinance":
+        source: PriceSource = YFinanceSource()
+    elif name == "http":
+        source = HttpSource(max_connections)
+    elif name == "replay":
+        if not replay_file:
+            raise ValueError("The replay price source needs a replay file")
+        source = ReplaySource(replay_file, replay_speed)
+    else:
+        raise ValueError(f"Unknown price source {name}")
+
+    if record_file:
+        source = RecordingSource(source, record_file)
+    return source
+
+
+# Process-wide source of ticker and FX quotes, see set_price_source()
+_price_source: PriceSource = YFinanceSource()
+
+
+def get_price_source() -> PriceSource:
+    return _price_source
+
+
+def set_price_source(source: PriceSource) -> None:
+    """
+    Replaces the source every ticker and FX fetch goes through, closing
+    the previous one.
+    """
+    global _price_source
+    previous, _price_source = _price_source, source
+    if previous is not source:
+        previous.close()
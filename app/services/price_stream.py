@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Set
+
+import orjson
+from services.price_cache import CachedPrice
+
+
+def encode_prices(ticker: str, prices: Dict[str, CachedPrice]) -> str:
+    """
+    Encodes the prices of a ticker as the JSON message sent to the stream
+    clients.
+    """
+    return orjson.dumps(
+        {
+            "ticker": ticker,
+            "prices": {
+                currency: {
+                    "price": record.price,
+                    "currency": currency,
+                    "server_data_time": record.date.isoformat(),
+                }
+                for currency, record in prices.items()
+            },
+        }
+    ).decode()
+
+
+class Subscriber:
+    """
+    A connected stream client with its bounded queue of pending messages.
+    """
+
+    def __init__(self, queue_size: int) -> None:
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(
+            maxsize=queue_size
+        )
+
+    async def get(self) -> Optional[str]:
+        """
+        Waits for the next message, None once the client has been dropped.
+        """
+        return await self.queue.get()
+
+
+class PriceStreamHub:
+    """
+    Fans the prices stored by the background job out to the connected
+    stream clients. Every message is encoded once and queued for each
+    subscriber of the ticker; clients that fall queue_size messages behind
+    are dropped instead of buffering for them without bounds.
+    """
+
+    def __init__(self, queue_size: int = 16) -> None:
+        self.queue_size = queue_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Only modified on the event loop
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(
+            len(subscribers) for subscribers in self._subscribers.values()
+        )
+
+    @contextmanager
+    def subscribe(self, ticker: str) -> Iterator[Subscriber]:
+        """
+        Registers a subscriber of the ticker for the duration of the block.
+        Must be called from the event loop serving the clients.
+        """
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(self.queue_size)
+        self._subscribers.setdefault(ticker, set()).add(subscriber)
+        try:
+            yield subscriber
+        finally:
+            self._subscribers.get(ticker, set()).discard(subscriber)
+
+    def publish(self, ticker: str, prices: Dict[str, CachedPrice]) -> None:
+        """
+        Broadcasts new prices of a ticker. Safe to call from any thread, the
+        messages are queued on the event loop.
+        """
+        loop = self._loop
+        if loop is None or not self._subscribers.get(ticker):
+            return
+
+        message = encode_prices(ticker, prices)
+        try:
+            loop.call_soon_threadsafe(self._broadcast, ticker, message)
+        except RuntimeError:
+            # The event loop has been closed on shutdown
+            pass
+
+    def _broadcast(self, ticker: str, message: str) -> None:
+        for subscriber in list(self._subscribers.get(ticker, ())):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._drop(ticker, subscriber)
+
+    def _drop(self, ticker: str, subscriber: Subscriber) -> None:
+        logging.warning(
+            f"Dropping {ticker} stream client {self.queue_size} messages "
+            "behind"
+        )
+        self._subscribers[ticker].discard(subscriber)
+        # Replace the backlog with the end-of-stream marker
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+
+# Process-wide hub shared by the scheduler jobs and the API routers
+price_hub = PriceStreamHub()
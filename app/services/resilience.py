@@ -0,0 +1,143 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Upper bound of a single backoff delay
+MAX_BACKOFF_SECS = 30.0
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit is open.
+    """
+
+
+def backoff_delay(attempt: int, base_secs: float, max_secs: float) -> float:
+    """
+    Returns the delay before retry number `attempt` (starting at 1): a
+    random duration up to the exponentially growing cap ("full jitter"),
+    so concurrent retries of the same upstream do not synchronize.
+    """
+    return random.uniform(0, min(max_secs, base_secs * 2 ** (attempt - 1)))
+
+
+def retry_budget(
+    timeout_secs: float,
+    retries: int,
+    backoff_secs: float,
+    max_backoff_secs: float = MAX_BACKOFF_SECS,
+) -> float:
+    """
+    Returns the longest time a call timing out after `timeout_secs` can
+    take with all its retries and backoff delays.
+    """
+    delays = sum(
+        min(max_backoff_secs, backoff_secs * 2**attempt)
+        for attempt in range(retries)
+    )
+    return timeout_secs * (retries + 1) + delays
+
+
+def call_with_retries(
+    func: Callable[[], T],
+    description: str,
+    retries: int,
+    backoff_secs: float,
+    max_backoff_secs: float = MAX_BACKOFF_SECS,
+) -> T:
+    """
+    Calls func, retrying up to `retries` times with jittered exponential
+    backoff. The last error is raised once the retries are exhausted.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            delay = backoff_delay(attempt, backoff_secs, max_backoff_secs)
+            logging.warning(
+                f"Failed to fetch {description} ({e}), "
+                f"retry {attempt}/{retries} in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures per upstream symbol. After
+    `failure_threshold` of them the circuit opens and the symbol is skipped
+    for `reset_timeout`, after which a single trial call is let through: a
+    success closes the circuit, a failure opens it again.
+    """
+
+    def __init__(
+        self, failure_threshold: int = 5, reset_mins: float = 5
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = timedelta(minutes=reset_mins)
+        self._lock = threading.Lock()
+        # Consecutive failures and, once open, when the circuit opened
+        self._state: Dict[str, Tuple[int, Optional[datetime]]] = {}
+
+    def allow(self, symbol: str) -> bool:
+        """
+        Returns whether the symbol may be fetched now. An open circuit
+        past its reset timeout lets one trial call through.
+        """
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            failures, opened_at = self._state.get(symbol, (0, None))
+            if opened_at is None:
+                return True
+            if now - opened_at < self.reset_timeout:
+                return False
+            # Half-open: hold the circuit open for others during the trial
+            self._state[symbol] = (failures, now)
+            return True
+
+    def record_success(self, symbol: str) -> None:
+        with self._lock:
+            _, opened_at = self._state.pop(symbol, (0, None))
+        if opened_at is not None:
+            logging.info(f"Circuit for {symbol} closed")
+
+    def record_failure(self, symbol: str) -> None:
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            failures, opened_at = self._state.get(symbol, (0, None))
+            failures += 1
+            if opened_at is None and failures < self.failure_threshold:
+                self._state[symbol] = (failures, None)
+                return
+            self._state[symbol] = (failures, now)
+        logging.error(
+            f"Circuit for {symbol} open after {failures} consecutive "
+            f"failures, skipping it for {self.reset_timeout}"
+        )
+
+    def call(self, symbol: str, func: Callable[[], T]) -> T:
+        """
+        Calls func unless the symbol's circuit is open, recording the
+        outcome.
+        """
+        if not self.allow(symbol):
+            raise CircuitOpenError(f"Circuit for {symbol} is open")
+        try:
+            result = func()
+        except Exception:
+            self.record_failure(symbol)
+            raise
+        self.record_success(symbol)
+        return result
+
+
+# Process-wide breaker shared by the ticker and FX fetches
+circuit_breaker = CircuitBreaker()
@@ -0,0 +1,161 @@
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+
+from database.db import Database
+from database.layout import has_prices, price_rows
+from database.models import DailyPriceRollup
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+# Rows fetched per round-trip while rebuilding the rollups
+REBUILD_BATCH_SIZE = 10000
+
+
+def bar_weight(bar: timedelta, fetch_interval: timedelta) -> float:
+    """
+    Returns how many fetched prices a backfilled bar stands for, so days
+    mixing bars and fetched prices (or bars of different intervals) are
+    averaged evenly over time.
+    """
+    return bar / fetch_interval
+
+
+def update_daily_rollups(db: Session, prices: List[Dict[str, Any]]) -> None:
+    """
+    Folds prices (ticker, currency, price and date mappings) into their
+    ticker/currency/day buckets with a single batched upsert. Runs inside the
+    caller's transaction, so the rollups commit together with the raw rows.
+    """
+    if not prices:
+        return
+
+    upsert_daily_rollups(
+        db,
+        [
+            {
+                "ticker": row["ticker"],
+                "currency": row["currency"],
+                "day": row["date"].date(),
+                "price_sum": row["price"],
+                "price_weight": 1.0,
+                "price_count": 1,
+                "price_min": row["price"],
+                "price_max": row["price"],
+                "price_first": row["price"],
+                "price_last": row["price"],
+                "first_date": row["date"],
+                "last_date": row["date"],
+            }
+            for row in prices
+        ],
+    )
+
+
+def upsert_daily_rollups(db: Session, buckets: List[Dict[str, Any]]) -> None:
+    """
+    Merges partial daily buckets (mappings of the rollup columns) into the
+    stored ones, so bulk loads can aggregate their rows before the upsert.
+    """
+    rollup = DailyPriceRollup.__table__
+    stmt = insert(rollup)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[rollup.c.ticker, rollup.c.currency, rollup.c.day],
+        set_={
+            "price_sum": rollup.c.price_sum + excluded.price_sum,
+            "price_weight": rollup.c.price_weight + excluded.price_weight,
+            "price_count": rollup.c.price_count + excluded.price_count,
+            "price_min": func.min(rollup.c.price_min, excluded.price_min),
+            "price_max": func.max(rollup.c.price_max, excluded.price_max),
+            "price_first": case(
+                (
+                    excluded.first_date < rollup.c.first_date,
+                    excluded.price_first,
+                ),
+                else_=rollup.c.price_first,
+            ),
+            "first_date": func.min(rollup.c.first_date, excluded.first_date),
+            "price_last": case(
+                (
+                    excluded.last_date >= rollup.c.last_date,
+                    excluded.price_last,
+                ),
+                else_=rollup.c.price_last,
+            ),
+            "last_date": func.max(rollup.c.last_date, excluded.last_date),
+        },
+    )
+    db.execute(stmt, buckets)
+
+
+def rebuild_rollups(db_instance: Database) -> int:
+    """
+    Recomputes all daily rollups from the stored prices and their weights
+    and returns the number of buckets written.
+    """
+    logging.info("Rebuilding daily price rollups")
+    buckets: Dict[Tuple[str, str, Any], Dict[str, Any]] = {}
+    prices = price_rows(db_instance)
+
+    with db_instance.session() as db:
+        rows = db.execute(
+            select(
+                prices.c.ticker,
+                prices.c.currency,
+                prices.c.date,
+                prices.c.price,
+                prices.c.weight,
+            )
+            .order_by(prices.c.ticker, prices.c.currency, prices.c.date)
+            .execution_options(yield_per=REBUILD_BATCH_SIZE)
+        )
+        for ticker, currency, date, price, weight in rows:
+            key = (ticker, currency, date.date())
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {
+                    "ticker": ticker,
+                    "currency": currency,
+                    "day": date.date(),
+                    "price_sum": price * weight,
+                    "price_weight": weight,
+                    "price_count": 1,
+                    "price_min": price,
+                    "price_max": price,
+                    "price_first": price,
+                    "price_last": price,
+                    "first_date": date,
+                    "last_date": date,
+                }
+                continue
+            # Rows arrive ordered by date within a ticker/currency
+            bucket["price_sum"] += price * weight
+            bucket["price_weight"] += weight
+            bucket["price_count"] += 1
+            bucket["price_min"] = min(bucket["price_min"], price)
+            bucket["price_max"] = max(bucket["price_max"], price)
+            bucket["price_last"] = price
+            bucket["last_date"] = date
+
+        db.execute(delete(DailyPriceRollup))
+        if buckets:
+            db.execute(
+                DailyPriceRollup.__table__.insert(), list(buckets.values())
+            )
+        db.commit()
+
+    logging.info(f"Rebuilt {len(buckets)} daily price rollups")
+    return len(buckets)
+
+
+def ensure_rollups(db_instance: Database) -> None:
+    """
+    Backfills the rollups for databases created before they were introduced.
+    """
+    with db_instance.session() as db:
+        has_rollups = db.query(DailyPriceRollup.day).first() is not None
+
+    if not has_rollups and has_prices(db_instance):
+        rebuild_rollups(db_instance)
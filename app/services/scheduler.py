@@ -1,53 +1,242 @@
 import argparse
 import logging
+import os
 import signal
-from datetime import datetime
-from typing import Dict, List, Union
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Union
 
 from apscheduler.schedulers.background import BackgroundScheduler
+from database.db import Database
+from database.layout import has_prices
+from services.analytics import rolling_stats
+from services.backfill import backfill_prices
 from services.cleanup import cleanup_db_data
-from services.price_data import store_prices
+from services.election import LeaderLock
+from services.fx import fx_rates
+from services.maintenance import maintain_db
+from services.metrics import instrument_scheduler
+from services.price_data import refresh_latest_prices, store_prices
+from services.price_sources import (
+    create_price_source,
+    get_price_source,
+    set_price_source,
+)
+from services.price_stream import price_hub
+from services.resilience import circuit_breaker, retry_budget
 
+FETCH_JOB_ID = "store_prices"
+FOLLOW_JOB_ID = "follow_leader"
 
-def init_services(args: argparse.Namespace) -> BackgroundScheduler:
+# Held for the lifetime of the process, closing its file releases the lock
+leader_lock: Optional[LeaderLock] = None
+
+
+def init_services(
+    args: argparse.Namespace, db_instance: Database
+) -> BackgroundScheduler:
     """Initialize the background services"""
     # TODO: provide a better way how to configure background services.
+    global leader_lock
     logging.info("Initializing services...")
-    scheduler = BackgroundScheduler()
+    # A run still going when the next is due is not started twice, late
+    # runs are merged into one instead of catching up one by one.
+    scheduler = BackgroundScheduler(
+        job_defaults={"coalesce": True, "max_instances": 1}
+    )
+    instrument_scheduler(scheduler)
+
+    # FX rates are cached independently of the price fetch interval
+    fx_rates.ttl = timedelta(minutes=args.fx_cache_ttl_mins)
+    fx_rates.timeout_secs = args.fetch_timeout_secs
+    fx_rates.retries = args.fetch_retries
+    fx_rates.backoff_secs = args.fetch_retry_backoff_secs
+
+    # Ticker and FX quotes are fetched through the configured source
+    set_price_source(
+        create_price_source(
+            args.price_source,
+            replay_file=args.replay_file,
+            replay_speed=args.replay_speed,
+            record_file=args.record_quotes_file,
+            max_connections=args.fetch_workers,
+        )
+    )
+
+    # Failing tickers and FX pairs are skipped for a while
+    circuit_breaker.failure_threshold = args.circuit_breaker_failures
+    circuit_breaker.reset_timeout = timedelta(
+        minutes=args.circuit_breaker_reset_mins
+    )
+
+    # Stored prices are pushed to the stream clients through the hub
+    price_hub.queue_size = args.stream_queue_size
+
+    # Rolling windows are kept up to date from the stored prices on
+    rolling_stats.configure(
+        [timedelta(minutes=mins) for mins in args.analytics_window_mins]
+    )
+    rolling_stats.load(db_instance, args.tickers, args.currencies)
+
+    # Only one of the processes sharing the database fetches and cleans up,
+    # the others follow it through the database until they take over.
+    lock = leader_lock = LeaderLock(
+        os.path.join(db_instance.db_dir, f"{db_instance.db_name}.lock")
+    )
+    if lock.acquire():
+        add_leader_jobs(scheduler, args, db_instance)
+    else:
+        logging.info("Another process runs the background jobs, following")
+        scheduler.add_job(
+            follow_leader,
+            "interval",
+            id=FOLLOW_JOB_ID,
+            seconds=args.cache_refresh_secs,
+            kwargs={
+                "scheduler": scheduler,
+                "lock": lock,
+                "args": args,
+                "db_instance": db_instance,
+            },
+        )
+
+    scheduler.start()
+    return scheduler
+
+
+def add_leader_jobs(
+    scheduler: BackgroundScheduler,
+    args: argparse.Namespace,
+    db_instance: Database,
+) -> None:
+    """
+    Schedules the jobs writing to the database: fetching prices, cleaning
+    up and maintenance.
+    """
+    # A fresh database, e.g. on a new pod without persistence, is
+    # backfilled in the background so the API serves while history loads.
+    # Checked up front, as the fetch job starts storing prices right away.
+    if args.backfill_days > 0 and not has_prices(db_instance):
+        scheduler.add_job(
+            backfill_history,
+            "date",
+            id="backfill_prices",
+            kwargs={
+                "db_instance": db_instance,
+                "tickers": args.tickers,
+                "currencies": args.currencies,
+                "days": args.backfill_days,
+                "fetch_interval": timedelta(
+                    minutes=int(args.fetch_interval_mins)
+                ),
+            },
+            misfire_grace_time=None,
+        )
 
     # Prepare arguments for the cleanup_db_data job
-    db_args: Dict[str, Union[str, int]] = {
-        "db_dir": args.dir,
+    db_args: Dict[str, Union[Database, float]] = {
+        "db_instance": db_instance,
         "retention_days": args.retention_days,
-        "db_name": args.name,
+        "batch_size": args.clean_up_batch_size,
+        "time_budget_secs": args.clean_up_time_budget_secs,
+        "vacuum_pages": args.clean_up_vacuum_pages,
     }
     scheduler.add_job(
         cleanup_db_data,
         "interval",
+        id="cleanup_db_data",
         minutes=args.clean_up_interval_mins,
         kwargs=db_args,
         next_run_time=datetime.now(),  # Start immediately
     )
 
     # Prepare arguments for the store_prices job
-    price_args: Dict[str, Union[str, List[str]]] = {
-        "db_dir": args.dir,
+    price_args: Dict[str, Union[Database, float, List[str]]] = {
+        "db_instance": db_instance,
         "currencies": args.currencies,
-        "db_name": args.name,
-        "ticker": args.ticker,
+        "tickers": args.tickers,
+        "fetch_workers": args.fetch_workers,
+        "fetch_timeout_secs": args.fetch_timeout_secs,
+        "fetch_retries": args.fetch_retries,
+        "fetch_retry_backoff_secs": args.fetch_retry_backoff_secs,
     }
+    fetch_interval_secs = int(args.fetch_interval_mins) * 60
+    budget = retry_budget(
+        args.fetch_timeout_secs,
+        args.fetch_retries,
+        args.fetch_retry_backoff_secs,
+    )
+    if budget > fetch_interval_secs:
+        logging.warning(
+            f"A ticker fetch can take up to {budget:.0f}s with retries, "
+            f"longer than the fetch interval, so fetches can be skipped"
+        )
     scheduler.add_job(
         store_prices,
         "interval",
+        id=FETCH_JOB_ID,
         minutes=args.fetch_interval_mins,
         kwargs=price_args,
         next_run_time=datetime.now(),  # Start immediately
+        # A late fetch is still worth running until the next one is due
+        misfire_grace_time=fetch_interval_secs,
     )
 
-    scheduler.start()
-    return scheduler
+    # Checkpoint the WAL and refresh planner statistics periodically
+    scheduler.add_job(
+        maintain_db,
+        "interval",
+        id="maintain_db",
+        minutes=args.db_maintenance_interval_mins,
+        kwargs={"db_instance": db_instance},
+    )
+
+
+def backfill_history(
+    db_instance: Database,
+    tickers: List[str],
+    currencies: List[str],
+    days: float,
+    fetch_interval: timedelta,
+) -> None:
+    """
+    Backfills the prices and reloads the rolling windows, which only pick
+    up prices newer than the ones they hold.
+    """
+    backfill_prices(db_instance, tickers, currencies, days, fetch_interval)
+    rolling_stats.load(db_instance, tickers, currencies, reload=True)
+
+
+def follow_leader(
+    scheduler: BackgroundScheduler,
+    lock: LeaderLock,
+    args: argparse.Namespace,
+    db_instance: Database,
+) -> None:
+    """
+    Takes over the background jobs once the leading process has exited,
+    until then refreshes the cached prices from the database.
+    """
+    if lock.acquire():
+        logging.info("Leading process exited, taking over background jobs")
+        scheduler.remove_job(FOLLOW_JOB_ID)
+        add_leader_jobs(scheduler, args, db_instance)
+        return
+
+    refresh_latest_prices(db_instance, args.tickers, args.currencies)
+
+
+def next_fetch_time(scheduler: BackgroundScheduler) -> Optional[datetime]:
+    """
+    Returns when the cached prices can change next: the next fetch, or the
+    next refresh in processes following the fetching one. None if neither
+    is scheduled.
+    """
+    job = scheduler.get_job(FETCH_JOB_ID) or scheduler.get_job(FOLLOW_JOB_ID)
+    return job.next_run_time if job is not None else None
 
 
 def shutdown_services(scheduler: BackgroundScheduler) -> None:
     logging.info("Shutting down services...")
-    scheduler.shutdown() 
+    if scheduler.running:
+        scheduler.shutdown()
+    get_price_source().close()
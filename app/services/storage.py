@@ -0,0 +1,99 @@
+import logging
+import time
+
+from database.db import Database
+from database.models import BitcoinPrice, CompactPrice, PriceSeries
+from database.types import PRICE_SCALE
+from services.maintenance import vacuum_db
+from sqlalchemy import (
+    Integer,
+    String,
+    cast,
+    delete,
+    func,
+    insert,
+    select,
+    type_coerce,
+)
+
+# Legacy rows copied per transaction
+MIGRATE_BATCH_SIZE = 50000
+
+
+def migrate_storage(
+    db_instance: Database, batch_size: int = MIGRATE_BATCH_SIZE
+) -> int:
+    """
+    Moves the prices of bitcoin_prices into the compact layout and vacuums
+    the database to return the space they took. Copying ignores prices
+    already migrated, so an interrupted migration can simply be run again.
+    Returns the number of rows copied.
+    """
+    logging.info(
+        f"Migrating {db_instance.db_dir}/{db_instance.db_name} prices to the "
+        "compact layout"
+    )
+    started = time.perf_counter()
+    legacy = BitcoinPrice.__table__
+
+    # Converted in SQL, the rows never leave SQLite. Dates are stored as
+    # "YYYY-MM-DD HH:MM:SS.ffffff", the milliseconds are characters 21-23.
+    date = type_coerce(legacy.c.date, String)
+    ts = cast(func.strftime("%s", date), Integer) * 1000 + cast(
+        func.substr(date, 21, 3), Integer
+    )
+    price = cast(func.round(legacy.c.price * PRICE_SCALE), Integer)
+    copy = (
+        select(PriceSeries.id, ts, price, legacy.c.weight)
+        .select_from(legacy)
+        .join(
+            PriceSeries,
+            (PriceSeries.ticker == legacy.c.ticker)
+            & (PriceSeries.currency == legacy.c.currency),
+        )
+    )
+
+    copied = 0
+    with db_instance.session() as db:
+        db.execute(
+            insert(PriceSeries)
+            .prefix_with("OR IGNORE")
+            .from_select(
+                ["ticker", "currency"],
+                select(legacy.c.ticker, legacy.c.currency).distinct(),
+            )
+        )
+        db.commit()
+
+        first_id, last_id = db.execute(
+            select(func.min(legacy.c.id), func.max(legacy.c.id))
+        ).one()
+        if first_id is not None:
+            for after in range(first_id - 1, last_id, batch_size):
+                copied += db.execute(
+                    insert(CompactPrice)
+                    .prefix_with("OR IGNORE")
+                    .from_select(
+                        ["series_id", "ts", "price", "weight"],
+                        copy.where(legacy.c.id > after).where(
+                            legacy.c.id <= after + batch_size
+                        ),
+                    )
+                ).rowcount
+                db.commit()
+                logging.debug(f"Migrated prices up to id {after + batch_size}")
+
+        db.execute(delete(BitcoinPrice))
+        db.commit()
+    db_instance.series_ids.clear()
+
+    vacuum_db(db_instance)
+    logging.info(
+        f"Migrated {copied} prices in {time.perf_counter() - started:.2f}s"
+    )
+    if not db_instance.compact_storage:
+        logging.warning(
+            "Start the application with --compact-storage to read the "
+            "migrated prices"
+        )
+    return copied
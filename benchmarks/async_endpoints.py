@@ -0,0 +1,192 @@
+"""
+Compares the request paths of /prices/averages on the same seeded database:
+a synchronous (threadpool) handler, an asynchronous handler querying through
+aiosqlite, and the application's router with the price cache cold (queries
+in the threadpool) and warm (served from memory).
+
+Example:
+
+    python benchmarks/async_endpoints.py --requests 5000 --concurrency 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from common import load  # noqa: E402
+from database.db import Database  # noqa: E402
+from database.models import DailyPriceRollup  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from routers.db_utils import get_averages  # noqa: E402
+from routers.prices import prices_router  # noqa: E402
+from services.price_cache import latest_prices  # noqa: E402
+from sqlalchemy import case, func, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+
+TICKER = "BTC-USD"
+CURRENCIES = ["EUR", "CZK", "GBP", "JPY"]
+API_KEY = "bench"
+PATH = "/prices/averages"
+HEADERS = {"api-key": API_KEY}
+
+
+def seed(db_instance: Database, days: int) -> None:
+    """
+    Writes daily rollups for every currency over the last `days` days.
+    """
+    today = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = []
+    for currency in CURRENCIES:
+        for offset in range(days):
+            date = today - timedelta(days=offset)
+            rows.append(
+                {
+                    "ticker": TICKER,
+                    "currency": currency,
+                    "day": date.date(),
+                    "price_sum": 60000.0 * 1440,
+                    "price_weight": 1440.0,
+                    "price_count": 1440,
+                    "price_min": 59000.0,
+                    "price_max": 61000.0,
+                    "price_first": 60000.0,
+                    "price_last": 60000.0,
+                    "first_date": date,
+                    "last_date": date,
+                }
+            )
+    with db_instance.session() as db:
+        db.execute(DailyPriceRollup.__table__.insert(), rows)
+        db.commit()
+
+
+def sync_app(db_instance: Database) -> FastAPI:
+    """
+    Serves the averages with a synchronous handler and session.
+    """
+    app = FastAPI()
+
+    @app.get("/prices/averages")
+    def average_prices() -> Dict[str, Any]:
+        with db_instance.session() as db:
+            averages = get_averages(db, TICKER, CURRENCIES)
+        return {"ticker": TICKER, "averages": averages}
+
+    return app
+
+
+def aiosqlite_app(db_instance: Database) -> FastAPI:
+    """
+    Serves the averages with an asynchronous handler and session.
+    """
+    app = FastAPI()
+
+    @app.get("/prices/averages")
+    async def average_prices() -> Dict[str, Any]:
+        async with db_instance.AsyncSessionLocal() as db:
+            return await get_averages_async(db)
+
+    return app
+
+
+async def get_averages_async(db: AsyncSession) -> Dict[str, Any]:
+    """
+    Asynchronous counterpart of the router's averages query.
+    """
+    today = datetime.now(timezone.utc).date()
+    is_today = DailyPriceRollup.day == today
+    averages = {}
+    for currency in CURRENCIES:
+        result = await db.execute(
+            select(
+                func.sum(case((is_today, DailyPriceRollup.price_sum))),
+                func.sum(case((is_today, DailyPriceRollup.price_weight))),
+                func.sum(case((~is_today, DailyPriceRollup.price_sum))),
+                func.sum(case((~is_today, DailyPriceRollup.price_weight))),
+            )
+            .where(DailyPriceRollup.ticker == TICKER)
+            .where(DailyPriceRollup.currency == currency)
+            .where(DailyPriceRollup.day >= today.replace(day=1))
+            .where(DailyPriceRollup.day <= today)
+        )
+        daily_sum, daily_weight, monthly_sum, monthly_weight = result.one()
+        averages[currency] = {
+            "daily_average": (
+                daily_sum / daily_weight if daily_weight else None
+            ),
+            "monthly_average": (
+                monthly_sum / monthly_weight if monthly_weight else None
+            ),
+        }
+    return {"ticker": TICKER, "averages": averages}
+
+
+def router_app(db_instance: Database) -> FastAPI:
+    """
+    Serves the averages through the application's router.
+    """
+    app = FastAPI()
+    app.include_router(
+        prices_router(db_instance, [TICKER], CURRENCIES, API_KEY)
+    )
+    return app
+
+
+async def compare(
+    db_instance: Database, requests: int, concurrency: int
+) -> Dict[str, Any]:
+    """
+    Benchmarks the apps on one event loop, which the async pool is bound to.
+    The router runs last, as warming the price cache cannot be undone.
+    """
+    results = {}
+    for name, app in (
+        ("sync", sync_app(db_instance)),
+        ("aiosqlite", aiosqlite_app(db_instance)),
+        ("router", router_app(db_instance)),
+        ("router_cached", router_app(db_instance)),
+    ):
+        if name == "router_cached":
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            for currency in CURRENCIES:
+                latest_prices.publish(TICKER, currency, 60000.0, now)
+        # Warm up the pools before measuring
+        await load(app, PATH, min(100, requests), concurrency, HEADERS)
+        results[name] = await load(app, PATH, requests, concurrency, HEADERS)
+    await db_instance.async_engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        db_instance = Database(
+            db_dir,
+            "bench.db",
+            pool_size=20,
+            pragmas={"journal_mode": "WAL", "synchronous": "NORMAL"},
+        )
+        db_instance.init_db()
+        seed(db_instance, args.days)
+
+        results = asyncio.run(
+            compare(db_instance, args.requests, args.concurrency)
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Helpers shared by the benchmarks.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, Any]:
+    """
+    Returns the throughput and latency percentiles of timed operations.
+    """
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    return {
+        "count": len(latencies),
+        "per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(p50, 3),
+        "p90_ms": round(p90, 3),
+        "p99_ms": round(p99, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+    }
+
+
+async def load(
+    app: FastAPI,
+    path: str,
+    requests: int,
+    concurrency: int,
+    headers: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """
+    Sends `requests` GET requests to the app with at most `concurrency` in
+    flight and returns the throughput and latency percentiles.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def request() -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(request() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    return {"concurrency": concurrency, **summarize(latencies, elapsed)}
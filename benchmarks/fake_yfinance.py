@@ -0,0 +1,136 @@
+"""
+Deterministic, offline stand-in for the parts of yfinance the application
+uses (Ticker.history and download). Prices are a smooth function of the
+symbol and the minute, so runs are reproducible and need no network.
+
+    import fake_yfinance
+    fake_yfinance.install(delay_secs=0.05)
+"""
+
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+# Rough levels of the symbols the benchmarks use, others start at 100
+BASE_PRICES = {
+    "BTC-USD": 60000.0,
+    "ETH-USD": 3000.0,
+    "EURUSD=X": 1.08,
+    "CZKUSD=X": 0.043,
+    "GBPUSD=X": 1.27,
+    "JPYUSD=X": 0.0067,
+    "CHFUSD=X": 1.12,
+    "PLNUSD=X": 0.25,
+}
+
+INTERVALS = {
+    "1m": timedelta(minutes=1),
+    "5m": timedelta(minutes=5),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+PERIODS = {"1d": timedelta(days=1), "5d": timedelta(days=5)}
+
+# Simulated network latency of every request, see install()
+request_delay_secs = 0.0
+
+
+def close_prices(symbol: str, index: pd.DatetimeIndex) -> np.ndarray:
+    """
+    Returns the closes of a symbol at the given times: a daily and an
+    hourly wave plus pseudo-random noise derived from the minute.
+    """
+    base = BASE_PRICES.get(symbol, 100.0)
+    phase = zlib.crc32(symbol.encode()) % 1000
+    minutes = index.asi8 // 60_000_000_000
+    noise = np.sin(minutes * 12.9898 + phase) * 43758.5453 % 1 - 0.5
+    return base * (
+        1
+        + 0.02 * np.sin(2 * np.pi * minutes / 1440 + phase)
+        + 0.005 * np.sin(2 * np.pi * minutes / 60 + phase)
+        + 0.001 * noise
+    )
+
+
+def bars(
+    symbol: str, start: datetime, end: datetime, interval: str
+) -> pd.DataFrame:
+    """
+    Returns the OHLC bars of a symbol starting between start and end.
+    """
+    index = pd.date_range(
+        pd.Timestamp(start).tz_convert("UTC").ceil(INTERVALS[interval]),
+        pd.Timestamp(end).tz_convert("UTC"),
+        freq=INTERVALS[interval],
+        inclusive="left",
+    )
+    close = close_prices(symbol, index)
+    return pd.DataFrame(
+        {"Open": close, "High": close, "Low": close, "Close": close},
+        index=index,
+    )
+
+
+def as_utc(value: Union[str, datetime]) -> datetime:
+    value = pd.Timestamp(value)
+    if value.tzinfo is None:
+        value = value.tz_localize("UTC")
+    return value.to_pydatetime()
+
+
+class Ticker:
+    def __init__(self, symbol: str) -> None:
+        self.ticker = symbol
+
+    def history(
+        self,
+        period: Optional[str] = None,
+        interval: str = "1m",
+        start: Optional[Union[str, datetime]] = None,
+        end: Optional[Union[str, datetime]] = None,
+        **kwargs,
+    ) -> pd.DataFrame:
+        time.sleep(request_delay_secs)
+        end = as_utc(end) if end is not None else datetime.now(timezone.utc)
+        if start is not None:
+            start = as_utc(start)
+        else:
+            start = end - PERIODS.get(period or "1d", timedelta(days=1))
+        return bars(self.ticker, start, end, interval)
+
+
+def download(
+    tickers: Union[str, List[str]],
+    period: str = "1d",
+    interval: str = "1m",
+    **kwargs,
+) -> pd.DataFrame:
+    """
+    Returns the bars of every symbol, with a (field, symbol) column level
+    when more than one is requested, like yfinance.
+    """
+    time.sleep(request_delay_secs)
+    symbols = tickers.split() if isinstance(tickers, str) else list(tickers)
+    end = datetime.now(timezone.utc)
+    start = end - PERIODS.get(period, timedelta(days=1))
+    frames = {symbol: bars(symbol, start, end, interval) for symbol in symbols}
+    if len(symbols) == 1:
+        return frames[symbols[0]]
+    return pd.concat(frames, axis=1).swaplevel(axis=1).sort_index(axis=1)
+
+
+def install(delay_secs: float = 0.0) -> None:
+    """
+    Replaces yfinance.Ticker and yfinance.download with the fakes, each
+    request sleeping `delay_secs` seconds.
+    """
+    global request_delay_secs
+    request_delay_secs = delay_secs
+    yf.Ticker = Ticker
+    yf.download = download
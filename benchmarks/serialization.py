@@ -0,0 +1,242 @@
+"""
+Measures the per-request cost of turning endpoint results into response
+bodies, comparing FastAPI's default path (response models validated and
+serialized again, encoded by the stdlib json module) with the encoding the
+price routers use (pre-encoded payloads and orjson).
+
+Example:
+
+    python benchmarks/serialization.py --repeat 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import numpy as np  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+from routers.db_utils import bucket_points, get_cached_prices  # noqa: E402
+from routers.responses import (  # noqa: E402
+    REQUEST_TIME_PLACEHOLDER,
+    JSONTemplate,
+)
+from schemas.prices import (  # noqa: E402
+    AveragePriceDetail,
+    AveragesResponse,
+    CurrentPricesResponse,
+    HistoryResponse,
+    OhlcPoint,
+    Resolution,
+)
+from services.price_cache import latest_prices  # noqa: E402
+
+TICKER = "BTC-USD"
+CURRENCIES = ["EUR", "CZK", "GBP", "JPY"]
+
+
+def default_encoder(model: type) -> Callable[[Any], bytes]:
+    """
+    Returns the encoding FastAPI applies to a handler result declared with
+    the response model and rendered by the default JSONResponse.
+    """
+    field = create_response_field(
+        name=f"Response_{model.__name__}", type_=model, mode="serialization"
+    )
+    loop = asyncio.new_event_loop()
+
+    def encode(content: Any) -> bytes:
+        serialized = loop.run_until_complete(
+            serialize_response(field=field, response_content=content)
+        )
+        return JSONResponse(serialized).body
+
+    return encode
+
+
+def make_buckets(count: int) -> np.ndarray:
+    """
+    Returns `count` one-minute history buckets with random prices.
+    """
+    rng = np.random.default_rng(0)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+    return np.column_stack(
+        (
+            start + 60.0 * np.arange(count),
+            rng.uniform(59000, 61000, (count, 5)),
+            rng.integers(1, 60, count),
+        )
+    )
+
+
+def model_points(buckets: np.ndarray) -> List[OhlcPoint]:
+    """
+    Builds the history points as validated models, as the router did.
+    """
+    return [
+        OhlcPoint(
+            time=datetime.fromtimestamp(bucket_time, tz=timezone.utc)
+            .replace(tzinfo=None)
+            .isoformat(),
+            open=open_price,
+            high=high,
+            low=low,
+            close=close,
+            average=average,
+            count=int(count),
+        )
+        for bucket_time, open_price, high, low, close, average, count in (
+            buckets.tolist()
+        )
+    ]
+
+
+def cases(history_points: List[int]) -> Dict[str, Dict[str, Callable]]:
+    """
+    Returns the before/after encoding of every measured response.
+    """
+    for currency in CURRENCIES:
+        latest_prices.publish(TICKER, currency, 60000.0, datetime.utcnow())
+    cached_at = latest_prices.updated_at.isoformat()
+
+    encode_current = default_encoder(CurrentPricesResponse)
+    template = JSONTemplate(
+        CurrentPricesResponse(
+            ticker=TICKER,
+            prices=get_cached_prices(
+                TICKER, CURRENCIES, REQUEST_TIME_PLACEHOLDER
+            ),
+            cached_at=cached_at,
+        )
+        .model_dump_json()
+        .encode(),
+        REQUEST_TIME_PLACEHOLDER,
+    )
+
+    def current_before() -> bytes:
+        client_time = datetime.now().isoformat()
+        return encode_current(
+            CurrentPricesResponse(
+                ticker=TICKER,
+                prices=get_cached_prices(TICKER, CURRENCIES, client_time),
+                cached_at=cached_at,
+            )
+        )
+
+    def current_after() -> bytes:
+        return template.render(datetime.now().isoformat())
+
+    averages = {
+        currency: {"daily_average": 60000.0, "monthly_average": 59500.0}
+        for currency in CURRENCIES
+    }
+    encode_averages = default_encoder(AveragesResponse)
+    averages_body = (
+        AveragesResponse(ticker=TICKER, averages=averages)
+        .model_dump_json()
+        .encode()
+    )
+
+    def averages_before() -> bytes:
+        return encode_averages(
+            AveragesResponse(
+                ticker=TICKER,
+                averages={
+                    currency: AveragePriceDetail(**values)
+                    for currency, values in averages.items()
+                },
+            )
+        )
+
+    def averages_after() -> bytes:
+        return averages_body
+
+    results = {
+        "current": {"before": current_before, "after": current_after},
+        "averages": {"before": averages_before, "after": averages_after},
+    }
+
+    encode_history = default_encoder(HistoryResponse)
+    for count in history_points:
+        buckets = make_buckets(count)
+
+        def history_before(buckets: np.ndarray = buckets) -> bytes:
+            return encode_history(
+                HistoryResponse(
+                    ticker=TICKER,
+                    currency="EUR",
+                    resolution=Resolution.MINUTE,
+                    downsampled=False,
+                    points=model_points(buckets),
+                )
+            )
+
+        def history_after(buckets: np.ndarray = buckets) -> bytes:
+            return ORJSONResponse(
+                {
+                    "ticker": TICKER,
+                    "currency": "EUR",
+                    "resolution": Resolution.MINUTE.value,
+                    "downsampled": False,
+                    "points": bucket_points(buckets),
+                }
+            ).body
+
+        results[f"history_{count}"] = {
+            "before": history_before,
+            "after": history_after,
+        }
+
+    return results
+
+
+def measure(encode: Callable[[], bytes], repeat: int) -> float:
+    """
+    Returns the best mean duration of `encode` in microseconds.
+    """
+    number = max(1, repeat)
+    return min(timeit.repeat(encode, number=number, repeat=5)) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1000,
+        help="Encodings per measurement of the small responses",
+    )
+    parser.add_argument(
+        "--history-points", type=int, nargs="+", default=[500, 5000]
+    )
+    args = parser.parse_args()
+
+    results = {}
+    for name, encoders in cases(args.history_points).items():
+        # Both paths produce the same document
+        before, after = encoders["before"], encoders["after"]
+        assert json.loads(before()).keys() == json.loads(after()).keys()
+
+        # History bodies are hundreds of times larger than the others
+        repeat = args.repeat if "history" not in name else args.repeat // 100
+        before_us = measure(before, repeat)
+        after_us = measure(after, repeat)
+        results[name] = {
+            "before_us": round(before_us, 1),
+            "after_us": round(after_us, 1),
+            "speedup": round(before_us / after_us, 1),
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Profiles the cold start of the application with `python -X importtime`:
+imports a module of the app in fresh interpreters and reports the total
+import time, the slowest top-level packages and which of the heavy
+dependencies got loaded at all. Results are written as JSON, so changes to
+the startup path can be compared.
+
+Example:
+
+    python benchmarks/startup.py --runs 5 --top 15
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+# Dependencies only the fetching process should need
+HEAVY_MODULES = ["yfinance", "pandas", "pyarrow", "lxml", "bs4", "requests"]
+
+
+def profile_import(module: str) -> List[Tuple[str, int, int]]:
+    """
+    Imports the module in a fresh interpreter and returns the
+    (name, self, cumulative) import times in microseconds of every module
+    it loaded.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def summarize_runs(
+    runs: List[List[Tuple[str, int, int]]], top: int
+) -> Dict[str, Any]:
+    """
+    Returns the median total import time, the top-level packages with the
+    most self time (summed over their submodules) and the heavy modules
+    loaded.
+    """
+    totals = sorted(sum(s for _, s, _ in modules) for modules in runs)
+    packages: Dict[str, List[int]] = defaultdict(list)
+    for modules in runs:
+        per_package: Dict[str, int] = defaultdict(int)
+        for name, self_us, _ in modules:
+            per_package[name.split(".")[0]] += self_us
+        for package, self_us in per_package.items():
+            packages[package].append(self_us)
+
+    medians = {
+        package: sorted(times)[len(times) // 2]
+        for package, times in packages.items()
+    }
+    slowest = sorted(medians.items(), key=lambda item: -item[1])[:top]
+    loaded = {name for name, _, _ in runs[0]}
+    return {
+        "total_ms": round(totals[len(totals) // 2] / 1000, 1),
+        "modules": len(runs[0]),
+        "slowest_packages_ms": {
+            package: round(self_us / 1000, 1) for package, self_us in slowest
+        },
+        "heavy_modules_loaded": [
+            module for module in HEAVY_MODULES if module in loaded
+        ],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--modules",
+        nargs="+",
+        default=["main", "services.scheduler"],
+        help="Modules of the app to import",
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument(
+        "-o", "--output", default="-", help="Results file, - for stdout"
+    )
+    args = parser.parse_args()
+
+    report = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "imports": {
+            module: summarize_runs(
+                [profile_import(module) for _ in range(args.runs)], args.top
+            )
+            for module in args.modules
+        },
+    }
+    output = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
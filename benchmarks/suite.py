@@ -0,0 +1,300 @@
+"""
+Benchmarks the price endpoints and background jobs at growing table sizes.
+A temporary SQLite database is filled with one-minute history through the
+backfill, with yfinance replaced by the deterministic fake, and at every
+size /prices/current, /prices/averages, store_prices and cleanup_db_data
+are measured. Results are written as JSON to compare runs offline, e.g.
+before and after a change or between --no-cache and pragma settings.
+
+Example:
+
+    python benchmarks/suite.py --days 7 30 365 --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import fake_yfinance  # noqa: E402
+from common import load, summarize  # noqa: E402
+from config import get_sqlite_pragmas  # noqa: E402
+from database.db import Database  # noqa: E402
+from database.layout import price_rows  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import ORJSONResponse  # noqa: E402
+from routers.prices import prices_router  # noqa: E402
+from services.backfill import backfill_prices  # noqa: E402
+from services.cleanup import cleanup_db_data  # noqa: E402
+from services.price_cache import latest_prices  # noqa: E402
+from services.price_data import store_prices  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+API_KEY = "bench"
+HEADERS = {"api-key": API_KEY}
+
+
+def make_database(
+    db_dir: str, db_name: str, args: argparse.Namespace
+) -> Database:
+    """
+    Creates a database with the pragmas under test.
+    """
+    db_instance = Database(
+        db_dir,
+        db_name,
+        pool_size=args.concurrency,
+        compact_storage=args.compact_storage,
+        pragmas=get_sqlite_pragmas(
+            auto_vacuum="INCREMENTAL",
+            journal_mode=args.journal_mode,
+            synchronous=args.synchronous,
+            busy_timeout_ms=5000,
+            mmap_size=args.mmap_size,
+            cache_size=-65536,
+            temp_store="MEMORY",
+        ),
+    )
+    db_instance.init_db()
+    return db_instance
+
+
+def disable_price_cache() -> None:
+    """
+    Keeps the latest price cache empty, so every request reads the database.
+    """
+    latest_prices.publish = lambda *args, **kwargs: None
+    latest_prices._prices = {}
+
+
+def database_size(db_instance: Database) -> Dict[str, int]:
+    """
+    Returns the number of stored prices and the database file size.
+    """
+    with db_instance.session() as db:
+        rows = db.execute(
+            select(func.count()).select_from(price_rows(db_instance))
+        ).scalar()
+    db_path = os.path.join(db_instance.db_dir, db_instance.db_name)
+    db_bytes = sum(
+        os.path.getsize(path)
+        for path in (db_path, f"{db_path}-wal")
+        if os.path.exists(path)
+    )
+    return {"rows": rows, "db_bytes": db_bytes}
+
+
+def measure_store_prices(
+    db_instance: Database, args: argparse.Namespace
+) -> Dict[str, Any]:
+    """
+    Runs the fetch job `store_runs` times against the fake yfinance.
+    """
+    latencies: List[float] = []
+    started = time.perf_counter()
+    for _ in range(args.store_runs):
+        run_started = time.perf_counter()
+        store_prices(
+            db_instance,
+            args.tickers,
+            args.currencies,
+            fetch_workers=8,
+            fetch_timeout_secs=30,
+            fetch_retries=0,
+            fetch_retry_backoff_secs=0,
+        )
+        latencies.append(time.perf_counter() - run_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def measure_cleanup(
+    db_instance: Database, days: int, args: argparse.Namespace
+) -> Dict[str, Any]:
+    """
+    Deletes the older half of the prices from a copy of the database, so
+    the following sizes keep their history.
+    """
+    with tempfile.TemporaryDirectory() as copy_dir:
+        copy = make_database(copy_dir, db_instance.db_name, args)
+        source = db_instance.engine.raw_connection()
+        target = copy.engine.raw_connection()
+        try:
+            source.driver_connection.backup(target.driver_connection)
+        finally:
+            source.close()
+            target.close()
+
+        result = cleanup_db_data(
+            copy,
+            retention_days=days / 2,
+            batch_size=args.clean_up_batch_size,
+            # One run measures the whole deletion
+            time_budget_secs=3600,
+        )
+        copy.engine.dispose()
+
+    return {
+        "rows_deleted": result.rows_deleted,
+        "batches": result.batches,
+        "elapsed_secs": round(result.elapsed_secs, 3),
+        "rows_per_sec": round(
+            (
+                result.rows_deleted / result.elapsed_secs
+                if result.elapsed_secs
+                else 0
+            ),
+            1,
+        ),
+    }
+
+
+async def run_suite(
+    db_instance: Database, args: argparse.Namespace
+) -> List[Dict[str, Any]]:
+    """
+    Grows the database through the sizes and measures each of them. Runs
+    on one event loop, which the async pool is bound to.
+    """
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.include_router(
+        prices_router(db_instance, args.tickers, args.currencies, API_KEY)
+    )
+
+    results = []
+    for days in sorted(args.days):
+        # Stored bars are skipped, so only the older days are added
+        started = time.perf_counter()
+        backfill_prices(
+            db_instance,
+            args.tickers,
+            args.currencies,
+            days,
+            timedelta(minutes=1),
+            interval="1m",
+        )
+        seed_secs = time.perf_counter() - started
+        size = database_size(db_instance)
+        print(
+            f"Benchmarking {days} days ({size['rows']} prices)",
+            file=sys.stderr,
+        )
+
+        if args.cache:
+            latest_prices.warm_up(db_instance, args.tickers, args.currencies)
+
+        result = {"days": days, **size, "seed_secs": round(seed_secs, 2)}
+        for name in ("current", "averages"):
+            path = f"/prices/{name}"
+            # Warm up the pools and caches before measuring
+            await load(
+                app, path, min(100, args.requests), args.concurrency, HEADERS
+            )
+            result[name] = await load(
+                app, path, args.requests, args.concurrency, HEADERS
+            )
+        result["store_prices"] = measure_store_prices(db_instance, args)
+        result["cleanup"] = measure_cleanup(db_instance, days, args)
+        results.append(result)
+
+    await db_instance.async_engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--days",
+        type=int,
+        nargs="+",
+        default=[7, 30, 365],
+        help="Table sizes to measure, in days of one-minute prices",
+    )
+    parser.add_argument("--tickers", nargs="+", default=["BTC-USD"])
+    parser.add_argument("--currencies", nargs="+", default=["EUR", "CZK"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--store-runs",
+        type=int,
+        default=20,
+        help="Fetch job runs measured per size",
+    )
+    parser.add_argument(
+        "--fetch-delay-ms",
+        type=float,
+        default=0,
+        help="Simulated latency of every yfinance request",
+    )
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Serve current prices from the in-memory cache",
+    )
+    parser.add_argument("--journal-mode", default="WAL")
+    parser.add_argument("--synchronous", default="NORMAL")
+    parser.add_argument("--mmap-size", type=int, default=268435456)
+    parser.add_argument("--clean-up-batch-size", type=int, default=5000)
+    parser.add_argument(
+        "--compact-storage",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Store prices in the compact layout",
+    )
+    parser.add_argument(
+        "-o", "--output", default="-", help="Results file, - for stdout"
+    )
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args()
+
+    # The application logs every request and fetch at INFO
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.WARNING,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    fake_yfinance.install(delay_secs=args.fetch_delay_ms / 1000)
+    if not args.cache:
+        disable_price_cache()
+
+    started_at = datetime.now(timezone.utc)
+    with tempfile.TemporaryDirectory() as db_dir:
+        db_instance = make_database(db_dir, "bench.db", args)
+        sizes = asyncio.run(run_suite(db_instance, args))
+        db_instance.engine.dispose()
+
+    report = {
+        "started_at": started_at.isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "debug")
+        },
+        "sizes": sizes,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The application imports its packages relative to app/, as when run
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
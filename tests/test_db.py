@@ -0,0 +1,32 @@
+import database.models  # noqa: F401
+from database.db import Database
+from sqlalchemy import inspect, text
+
+
+def get_index_names(db_instance: Database) -> set:
+    return {
+        index["name"]
+        for index in inspect(db_instance.engine).get_indexes("bitcoin_prices")
+    }
+
+
+def test_migrate_db_only_drops_legacy_indexes(tmp_path):
+    db_instance = Database(str(tmp_path), "test.db")
+    db_instance.init_db()
+    with db_instance.engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE INDEX ix_bitcoin_prices_currency_date "
+                "ON bitcoin_prices (currency, date, price)"
+            )
+        )
+        connection.execute(
+            text("CREATE INDEX ix_operator_price ON bitcoin_prices (price)")
+        )
+
+    db_instance.init_db()
+
+    indexes = get_index_names(db_instance)
+    assert "ix_bitcoin_prices_currency_date" not in indexes
+    assert "ix_operator_price" in indexes
+    assert "ix_bitcoin_prices_ticker_currency_date" in indexes
@@ -0,0 +1,73 @@
+from typing import Dict, List
+
+import pytest
+from services import fx
+from services.fx import FxRateCache
+from services.price_sources import (
+    PriceSource,
+    get_price_source,
+    set_price_source,
+)
+from services.resilience import CircuitBreaker
+
+
+class QuoteSource(PriceSource):
+    """
+    Serves fixed quotes, recording the symbols requested.
+    """
+
+    def __init__(self, quotes: Dict[str, float]) -> None:
+        self.quotes = quotes
+        self.requested: List[str] = []
+
+    def get_price(self, symbol: str, timeout_secs: float) -> float:
+        self.requested.append(symbol)
+        if symbol not in self.quotes:
+            raise ValueError(f"no quote for {symbol}")
+        return self.quotes[symbol]
+
+
+@pytest.fixture
+def rates(monkeypatch):
+    monkeypatch.setattr(fx, "circuit_breaker", CircuitBreaker())
+    source = get_price_source()
+    cache = FxRateCache(ttl_mins=0)
+    cache.retries = 0
+    yield cache
+    set_price_source(source)
+
+
+def test_direct_pair(rates):
+    source = QuoteSource({"EURUSD=X": 1.1})
+    set_price_source(source)
+
+    assert rates.get_usd_rates(["EUR"]) == {"USD": 1.0, "EUR": 1.1}
+    assert source.requested == ["EURUSD=X"]
+
+
+def test_inverse_pair_fallback(rates):
+    source = QuoteSource({"USDJPY=X": 150.0})
+    set_price_source(source)
+
+    usd_rates = rates.get_usd_rates(["JPY"])
+    assert usd_rates["JPY"] == pytest.approx(1 / 150.0)
+    assert source.requested == ["JPYUSD=X", "USDJPY=X"]
+
+    # The working form is remembered, the direct pair is not tried again
+    source.requested.clear()
+    source.quotes["USDJPY=X"] = 160.0
+    usd_rates = rates.get_usd_rates(["JPY"])
+    assert usd_rates["JPY"] == pytest.approx(1 / 160.0)
+    assert source.requested == ["USDJPY=X"]
+
+
+def test_known_pair_failure_keeps_last_rate(rates):
+    source = QuoteSource({"EURUSD=X": 1.1, "USDEUR=X": 0.5})
+    set_price_source(source)
+    rates.get_usd_rates(["EUR"])
+
+    # An outage of the known pair is not a reason to switch forms
+    del source.quotes["EURUSD=X"]
+    source.requested.clear()
+    assert rates.get_usd_rates(["EUR"])["EUR"] == 1.1
+    assert source.requested == ["EURUSD=X"]
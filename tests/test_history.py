@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import database.models  # noqa: F401
+import numpy as np
+import pytest
+from database.db import Database
+from database.layout import insert_prices
+from fastapi import HTTPException
+from routers.db_utils import (
+    aggregate_prices,
+    get_intraday_buckets,
+    get_price_history,
+)
+from schemas.prices import Resolution
+
+TICKER = "BTC-USD"
+START = datetime(2024, 1, 1)
+
+
+@pytest.fixture(params=[False, True], ids=["legacy", "compact"])
+def db_instance(request, tmp_path):
+    db_instance = Database(
+        str(tmp_path), "test.db", compact_storage=request.param
+    )
+    db_instance.init_db()
+    # 30 days of prices every 7 minutes, so buckets hold uneven counts
+    rng = np.random.default_rng(0)
+    rows = [
+        {
+            "ticker": TICKER,
+            "currency": "EUR",
+            "price": round(float(price), 6),
+            "date": START + timedelta(minutes=7 * index, seconds=13),
+        }
+        for index, price in enumerate(
+            60000 + rng.normal(0, 50, 30 * 24 * 60 // 7).cumsum()
+        )
+    ]
+    with db_instance.session() as db:
+        insert_prices(db, db_instance, rows)
+        db.commit()
+    yield db_instance
+    asyncio.run(db_instance.async_engine.dispose())
+
+
+def run(db_instance: Database, query, *args):
+    async def execute():
+        async with db_instance.AsyncSessionLocal() as db:
+            return await query(db, db_instance, *args)
+
+    return asyncio.run(execute())
+
+
+def test_sql_aggregation_matches_raw_buckets(db_instance):
+    end = START + timedelta(days=3)
+    args = (TICKER, "EUR", START, end, 60 * 60)
+
+    aggregated = run(db_instance, aggregate_prices, *args)
+    raw = run(db_instance, get_intraday_buckets, *args)
+
+    assert aggregated.shape == raw.shape == (72, 7)
+    np.testing.assert_allclose(aggregated, raw, rtol=1e-12)
+
+
+def test_large_range_is_aggregated(db_instance):
+    end = START + timedelta(days=30)
+    buckets = run(
+        db_instance,
+        get_intraday_buckets,
+        TICKER,
+        "EUR",
+        START,
+        end,
+        60 * 60,
+    )
+
+    assert len(buckets) == 30 * 24
+    assert buckets[:, 6].sum() == 30 * 24 * 60 // 7
+    assert (buckets[:, 2] >= buckets[:, 3]).all()
+
+    points, downsampled = run(
+        db_instance,
+        get_price_history,
+        TICKER,
+        "EUR",
+        START,
+        end,
+        Resolution.HOUR,
+        100,
+    )
+    assert downsampled
+    assert len(points) == 100
+
+
+def test_too_many_buckets_are_rejected(db_instance):
+    with pytest.raises(HTTPException) as error:
+        run(
+            db_instance,
+            get_price_history,
+            TICKER,
+            "EUR",
+            START,
+            START + timedelta(days=30),
+            Resolution.MINUTE,
+            100,
+        )
+    assert error.value.status_code == 400
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+import main
+
+
+def test_fx_cache_ttl_is_parsed_as_number(monkeypatch):
+    monkeypatch.setattr("sys.argv", ["main.py", "--fx-cache-ttl-mins", "30"])
+    args = main.get_arguments()
+
+    assert args.fx_cache_ttl_mins == 30
+    assert timedelta(minutes=args.fx_cache_ttl_mins) == timedelta(minutes=30)
+
+
+def test_fx_cache_ttl_defaults_from_env(monkeypatch):
+    monkeypatch.setattr("sys.argv", ["main.py"])
+    monkeypatch.setenv("FX_CACHE_TTL_MINS", "2.5")
+    args = main.get_arguments()
+
+    assert args.fx_cache_ttl_mins == 2.5
@@ -0,0 +1,40 @@
+import threading
+import time
+
+import httpx
+from services.price_sources import HttpSource
+
+QUOTES = {"EURUSD=X": 1.1, "GBPUSD=X": 1.3, "USDJPY=X": 150.0}
+DELAY_SECS = 0.2
+
+
+def test_http_source_fetches_symbols_concurrently():
+    requested = []
+    lock = threading.Lock()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        symbol = request.url.path.rsplit("/", 1)[-1]
+        with lock:
+            requested.append(symbol)
+        time.sleep(DELAY_SECS)
+        if symbol not in QUOTES:
+            return httpx.Response(200, json={"chart": {"result": []}})
+        meta = {"regularMarketPrice": QUOTES[symbol]}
+        return httpx.Response(
+            200, json={"chart": {"result": [{"meta": meta}]}}
+        )
+
+    source = HttpSource(max_connections=8)
+    source.client.close()
+    source.client = httpx.Client(transport=httpx.MockTransport(handler))
+
+    started = time.perf_counter()
+    prices = source.get_prices([*QUOTES, "XYZUSD=X"], timeout_secs=5)
+    elapsed = time.perf_counter() - started
+    source.close()
+
+    # Symbols without data are left out
+    assert prices == QUOTES
+    assert sorted(requested) == sorted([*QUOTES, "XYZUSD=X"])
+    # One round trip for the whole batch instead of one per symbol
+    assert elapsed < 2 * DELAY_SECS
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import database.models  # noqa: F401
+import pandas as pd
+import pytest
+from database.db import Database
+from database.layout import insert_prices
+from routers.db_utils import get_averages
+from services.history import insert_rows
+from services.rollups import bar_weight, rebuild_rollups, update_daily_rollups
+
+# The daily average is the one of the current UTC day
+DAY = datetime.now(timezone.utc).replace(
+    tzinfo=None, hour=0, minute=0, second=0, microsecond=0
+)
+FETCH_INTERVAL = timedelta(minutes=1)
+
+
+@pytest.fixture(params=[False, True], ids=["legacy", "compact"])
+def db_instance(request, tmp_path):
+    db_instance = Database(
+        str(tmp_path), "test.db", compact_storage=request.param
+    )
+    db_instance.init_db()
+    return db_instance
+
+
+def get_daily_average(db_instance: Database) -> float:
+    with db_instance.session() as db:
+        return get_averages(db, "BTC-USD", ["EUR"])["EUR"].daily_average
+
+
+def store_fetched(db_instance: Database, prices: List[float], step: timedelta):
+    fetched = [
+        {
+            "ticker": "BTC-USD",
+            "currency": "EUR",
+            "price": price,
+            "date": DAY + step * index,
+        }
+        for index, price in enumerate(prices)
+    ]
+    with db_instance.session() as db:
+        insert_prices(db, db_instance, fetched)
+        update_daily_rollups(db, fetched)
+        db.commit()
+
+
+def test_mixed_day_is_averaged_over_time(db_instance):
+    # Prices fetched every minute in the morning, hourly bars backfilled
+    # for the afternoon
+    store_fetched(db_instance, [100.0] * 12 * 60, timedelta(minutes=1))
+    bars = pd.DataFrame(
+        {
+            "ticker": "BTC-USD",
+            "currency": "EUR",
+            "price": 200.0,
+            "date": pd.date_range(
+                DAY + timedelta(hours=12), periods=12, freq="h"
+            ),
+        }
+    )
+    insert_rows(
+        db_instance, bars, bar_weight(timedelta(hours=1), FETCH_INTERVAL)
+    )
+
+    assert get_daily_average(db_instance) == pytest.approx(150.0)
+
+    rebuild_rollups(db_instance)
+    assert get_daily_average(db_instance) == pytest.approx(150.0)
+
+
+def test_rebuild_keeps_regular_fetched_prices_unweighted(db_instance):
+    # Fetched prices spaced exactly like backfilled bars still weigh 1
+    store_fetched(db_instance, [100.0, 200.0, 600.0], timedelta(hours=1))
+    assert get_daily_average(db_instance) == pytest.approx(300.0)
+
+    rebuild_rollups(db_instance)
+    assert get_daily_average(db_instance) == pytest.approx(300.0)